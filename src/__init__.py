@@ -2,6 +2,15 @@ from src.cartilage_reconstruction import *
 from src.cargen_utils import *
 from src.volgen_utils import *
 from src.febgen_utils import *
+from src.febio_utils import *
+from src.store_utils import *
+from src.catalog_utils import *
+from src.writer_utils import *
+from src.labelmap_utils import *
+from src.topology_utils import *
+from src.faceset_utils import *
+from src.measure_utils import *
+from src.geodesic_utils import *
 from src.morpho_utils import *
 from src.params import *
 
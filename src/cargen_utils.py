@@ -1,10 +1,21 @@
 import numpy as np
+import hashlib
+import os
+import re
+import time
+from concurrent import futures
 import igl
 import meshplot as mp
 import matplotlib.pyplot as plt
 import math
 import wildmeshing as wm
 import sys
+from scipy import sparse
+from scipy.sparse.linalg import splu
+from src.writer_utils import atomic_write, submit_or_write
+from src.topology_utils import MeshTopology
+from src.faceset_utils import FaceSetMorphology
+from src.measure_utils import face_areas, contact_area
 
 
 def clean(vertices, faces):
@@ -26,38 +37,295 @@ def clean(vertices, faces):
     return vertices, faces
 
 
-def read (path, input_dimension):
+stl_record = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+stl_vertex_pattern = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+
+def _stl_chunks(path, chunk_size):
+
+    """
+    this function yields the triangle corners of an STL file (binary or ascii) as (n, 3, 3) arrays of at most
+    chunk_size triangles, so the file is never in memory as a whole
+    """
+
+    file_size = os.path.getsize(path)
+
+    with open(path, 'rb') as stl_file:
+        header = stl_file.read(84)
+        count = int(np.frombuffer(header[80:84], dtype='<u4')[0]) if len(header) == 84 else -1
+
+        if file_size == 84 + count * stl_record.itemsize:
+            while count > 0:
+                records = np.frombuffer(stl_file.read(min(count, chunk_size) * stl_record.itemsize), dtype=stl_record)
+                count -= len(records)
+                yield records['vertices']
+            return
+
+        # ascii: cut the text after the last complete loop of each block and keep the rest for the next one
+        stl_file.seek(0)
+        rest = b''
+        for block in iter(lambda: stl_file.read(chunk_size * 256), b''):
+            text = rest + block
+            end = text.rfind(b'endloop')
+            if end < 0:
+                rest = text
+                continue
+            rest = text[end + 7:]
+            corners = np.array(stl_vertex_pattern.findall(text[:end]), dtype=np.float64)
+            if len(corners) > 0:
+                yield corners.reshape(-1, 3, 3)
+
+
+weld_hash_factors = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+
+def _weld_cells(corners, epsilon):
+
+    # the integer cell of each corner: the bits of its coordinates, or its cell of the epsilon grid
+    if epsilon is None:
+        return corners.view(np.uint32 if corners.itemsize == 4 else np.uint64)
+    return np.floor(corners / epsilon + 0.5).astype(np.int64)
+
+
+def _stream_weld(path, epsilon, chunk_size, hashed):
+
+    """
+    this function welds the corners of an STL file chunk by chunk. With hashed=True the cells are reduced to a 64 bit
+    hash, which is much faster to sort and look up than the cells themselves; every chunk is checked against the
+    vertices it was welded to and None is returned on a hash collision.
+
+    :return: the welded vertices and faces, or None
+    """
+
+    table = {}
+    positions = None
+    count = 0
+    face_chunks = []
+
+    for corners in _stl_chunks(path, chunk_size):
+        # + 0.0 turns -0.0 into 0.0, the two must give the same key
+        corners = corners.reshape(-1, 3) + corners.dtype.type(0)
+        cells = _weld_cells(corners, epsilon)
+        if hashed:
+            keys = np.bitwise_xor.reduce(cells.astype(np.uint64) * weld_hash_factors, axis=1)
+        else:
+            keys = np.ascontiguousarray(cells).view(np.dtype((np.void, cells.itemsize * 3))).ravel()
+
+        unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        ids = np.fromiter((table.setdefault(key, len(table)) for key in unique_keys.tolist()),
+                          dtype=np.int64, count=len(unique_keys))
+        new = ids >= count
+
+        # the positions grow by doubling, so appending stays linear in the number of vertices
+        if positions is None:
+            positions = np.empty((max(len(table), 1024), 3), dtype=corners.dtype)
+        elif len(table) > len(positions):
+            positions = np.concatenate([positions, np.empty((max(len(table), 2 * len(positions)) - len(positions), 3),
+                                                            dtype=positions.dtype)])
+        positions[ids[new]] = corners[first[new]]
+        count = len(table)
+
+        corner_ids = ids[inverse.ravel()]
+        if hashed and not np.array_equal(_weld_cells(positions[corner_ids], epsilon), cells):
+            return None
+        face_chunks.append(corner_ids.reshape(-1, 3))
+
+    vertices = positions[:count].astype(np.float64) if positions is not None else np.zeros((0, 3))
+    faces = np.concatenate(face_chunks) if face_chunks else np.zeros((0, 3), dtype=np.int64)
+
+    return vertices, faces
+
+
+def stream_clean_stl(path, input_dimension, epsilon=None, chunk_size=1 << 18):
+
+    """
+    this function reads and cleans a (dense) STL file in one streaming pass. Vertices are welded while the file is
+    parsed through a hash of their coordinates, so only the unique vertices are kept in memory, and duplicated faces
+    are resolved on a packed face key like igl.resolve_duplicated_faces does. This gives the same mesh as
+    read_and_clean for STL files, whose triangles store their own copies of the shared corners, in a fraction of the
+    time and memory.
+
+    :param path: path of the STL file (binary or ascii)
+    :param input_dimension: the dimension of the input mesh ("mm" = millimeters, "m" = meters)
+    :param epsilon: None welds bit-identical corners only, otherwise corners that fall in the same cell of a grid with
+    spacing epsilon (in the unit of the file) are welded
+    :param chunk_size: the number of triangles parsed at a time
+
+    :return: the cleaned vertices and faces
+    """
+
+    welded = _stream_weld(str(path), epsilon, chunk_size, hashed=True)
+    if welded is None:
+        print("hash collision while welding, welding on the exact coordinates")
+        welded = _stream_weld(str(path), epsilon, chunk_size, hashed=False)
+    vertices, faces = welded
+
+    # degenerate faces: two corners welded into one
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+
+    # duplicated faces: like igl.resolve_duplicated_faces, one face is kept when one orientation outnumbers the other
+    # by exactly one, otherwise all copies are removed
+    if len(faces) > 0:
+        order = np.argsort(faces, axis=1)
+        sorted_faces = np.take_along_axis(faces, order, axis=1)
+        # an even permutation of the corners keeps the orientation
+        sign = np.where((order == [0, 1, 2]).all(1) | (order == [1, 2, 0]).all(1) | (order == [2, 0, 1]).all(1), 1, -1)
+
+        n = len(vertices)
+        if n < (1 << 21):
+            keys = (sorted_faces[:, 0] << 42) | (sorted_faces[:, 1] << 21) | sorted_faces[:, 2]
+        else:
+            keys = np.ascontiguousarray(sorted_faces).view(np.dtype((np.void, 24))).ravel()
+        _, group = np.unique(keys, return_inverse=True)
+        group = group.ravel()
+        net = np.bincount(group, weights=sign).astype(np.int64)
+
+        keep = np.zeros(len(faces), dtype=bool)
+        wanted = np.where(np.abs(net) == 1, net, 0)[group]
+        candidates = np.nonzero((wanted != 0) & (sign == wanted))[0]
+        _, first = np.unique(group[candidates], return_index=True)
+        keep[candidates[first]] = True
+        faces = faces[keep]
+
+    # unreferenced vertices
+    used = np.zeros(len(vertices), dtype=bool)
+    used[faces.ravel()] = True
+    new_index = np.cumsum(used) - 1
+    vertices = vertices[used]
+    faces = new_index[faces]
+
+    if input_dimension == "m":
+        vertices = vertices * 1000
+
+    print("number of faces after cleaning", len(faces))
+
+    return vertices, faces
+
+
+def _mesh_cache_key(path, input_dimension, stage):
+
+    """
+    this function builds the cache key of a surface mesh from the content of the file, the input dimension and the
+    processing stage
+
+    :param path: a path where the surface mesh is stored in
+    :param input_dimension: the dimension of the input mesh
+    :param stage: "read" or "clean"
+
+    :return: the cache key
+    """
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as mesh_file:
+        for block in iter(lambda: mesh_file.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest() + '_' + str(input_dimension) + '_' + stage
+
+
+def _load_cached_mesh(cache_dir, key):
+
+    """
+    this function loads a cached surface mesh, copy-on-write memory-mapped
+
+    :param cache_dir: the cache directory
+    :param key: the cache key
+
+    :return: the vertices and faces, or None if the mesh is not cached
+    """
+
+    vertices_path = os.path.join(cache_dir, key + '_vertices.npy')
+    faces_path = os.path.join(cache_dir, key + '_faces.npy')
+
+    if not (os.path.isfile(vertices_path) and os.path.isfile(faces_path)):
+        return None
+
+    vertices = np.load(vertices_path, mmap_mode='c', allow_pickle=False)
+    faces = np.load(faces_path, mmap_mode='c', allow_pickle=False)
+
+    return vertices, faces
+
+
+def _save_cached_mesh(cache_dir, key, vertices, faces):
+
+    """
+    this function stores a surface mesh in the cache. The files go through atomic_write, so a reader never sees a
+    half-written entry.
+
+    :param cache_dir: the cache directory
+    :param key: the cache key
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    """
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # faces first: an entry only counts as cached once the vertices file exists as well
+    for name, array in (('_faces.npy', faces), ('_vertices.npy', vertices)):
+        atomic_write(np.save, os.path.join(cache_dir, key + name), np.ascontiguousarray(array), allow_pickle=False)
+
+
+def read (path, input_dimension, cache_dir=None):
 
     """
     this function reads vertex and face information from an input surface mesh
 
     :param path: a path where the surface meshes are stored in
     :param input_dimension: the dimension of the input mesh ("mm" = millimeters, "m" = meters)
+    :param cache_dir: optional directory of a binary cache keyed by the file content and input dimension
 
     :return: the vertices and faces corresponding to the input mesh
     """
 
+    if cache_dir is not None:
+        key = _mesh_cache_key(path, input_dimension, 'read')
+        cached = _load_cached_mesh(cache_dir, key)
+        if cached is not None:
+            vertices, faces = cached
+            print("number of faces after reading", len(faces))
+            return vertices, faces
+
     vertices, faces = igl.read_triangle_mesh(path, 'float')
 
     if input_dimension == "m":
         vertices = vertices * 1000
 
+    if cache_dir is not None:
+        _save_cached_mesh(cache_dir, key, vertices, faces)
+
     print("number of faces after reading", len(faces))
 
     return vertices, faces
 
 
-def read_and_clean(path, input_dimension):
+def read_and_clean(path, input_dimension, cache_dir=None, streaming=False):
 
     """
     this function reads vertex and face information from an input surface mesh
 
     :param path: a path where the surface meshes are stored in
     :param input_dimension: the dimension of the input mesh ("mm" = millimeters, "m" = meters)
+    :param cache_dir: optional directory of a binary cache keyed by the file content and input dimension
+    :param streaming: read and clean STL files in one streaming pass, see stream_clean_stl
 
     :return: the vertices and faces corresponding to the input mesh
     """
 
+    if cache_dir is not None:
+        key = _mesh_cache_key(path, input_dimension, 'clean')
+        cached = _load_cached_mesh(cache_dir, key)
+        if cached is not None:
+            vertices, faces = cached
+            print("number of faces after cleaning", len(faces))
+            return vertices, faces
+
+    if streaming and str(path).lower().endswith('.stl'):
+        vertices, faces = stream_clean_stl(path, input_dimension)
+        if cache_dir is not None:
+            _save_cached_mesh(cache_dir, key, vertices, faces)
+        return vertices, faces
+
     vertices, faces = igl.read_triangle_mesh(path, 'float')
 
     if input_dimension == "m":
@@ -65,11 +333,64 @@ def read_and_clean(path, input_dimension):
 
     vertices, faces = clean(vertices, faces)
 
+    if cache_dir is not None:
+        _save_cached_mesh(cache_dir, key, vertices, faces)
+
     print("number of faces after cleaning", len(faces))
 
     return vertices, faces
 
 
+def _timed_read(path, input_dimension, cache_dir):
+
+    start = time.perf_counter()
+    vertices, faces = read(path, input_dimension, cache_dir=cache_dir)
+
+    return vertices, faces, time.perf_counter() - start
+
+
+def read_all(paths, input_dimension, max_workers=None, use_processes=False, cache_dir=None):
+
+    """
+    this function reads several surface meshes concurrently and reports the time spent on each one
+
+    :param paths: a dictionary of name -> path, or a list of paths (then the file names without suffix are the names)
+    :param input_dimension: the dimension of the input meshes ("mm" = millimeters, "m" = meters)
+    :param max_workers: the number of workers, by default one per mesh up to the number of cpus
+    :param use_processes: use a process pool instead of threads, for when the parsing itself is the bottleneck
+    :param cache_dir: optional directory of the binary mesh cache, see read
+
+    :return: a dictionary of name -> (vertices, faces)
+    """
+
+    if not isinstance(paths, dict):
+        paths = {os.path.splitext(os.path.basename(str(path)))[0]: path for path in paths}
+
+    if max_workers is None:
+        max_workers = max(1, min(len(paths), os.cpu_count() or 1))
+
+    pool = futures.ProcessPoolExecutor if use_processes else futures.ThreadPoolExecutor
+
+    start = time.perf_counter()
+    meshes = {}
+    timing = {}
+
+    with pool(max_workers=max_workers) as executor:
+        jobs = {name: executor.submit(_timed_read, str(path), input_dimension, cache_dir) for name, path in paths.items()}
+        for name, job in jobs.items():
+            vertices, faces, elapsed = job.result()
+            meshes[name] = (vertices, faces)
+            timing[name] = elapsed
+
+    total = time.perf_counter() - start
+
+    for name in paths:
+        print("read %s in %.3f s" % (name, timing[name]))
+    print("read %d meshes in %.3f s (%.3f s one after another)" % (len(paths), total, sum(timing.values())))
+
+    return meshes
+
+
 def remesh(vertices, faces, epsilon, edge_length):
 
     """
@@ -287,7 +608,8 @@ def get_initial_surface_bc(vertices_p,
 
 def get_boundary_faces(faces,
                        sub_face_idxs,
-                       face_adjacency, cumulative_sum):
+                       face_adjacency, cumulative_sum,
+                       morphology=None):
 
     """
     This function determines the facet indices belonging to the boundary of a sub-region.
@@ -296,18 +618,18 @@ def get_boundary_faces(faces,
     :param sub_face_idxs: list of facet indices corresponding to the sub-region you want to find the boundary
     :param face_adjacency: The face adjacency matrix
     :param cumulative_sum: cumulative sum of "face-vertex visiting procedure" from libigl
+    :param morphology: the FaceSetMorphology of faces (e.g. MeshTopology.morphology), built here when it is not given
 
-    :return: Boundary face indices on both sides of the boundary and the inner boundary face indices
+    :return: Boundary face indices on both sides of the boundary and the inner boundary face indices (both sorted)
     """
 
-    edge_vertex_idxs = igl.boundary_facets(faces[sub_face_idxs])
-    boundary_vertex_idxs = np.unique(edge_vertex_idxs.flatten())
+    if morphology is None:
+        morphology = FaceSetMorphology(faces, face_adjacency, cumulative_sum)
+    face_set = morphology.multiplicity(sub_face_idxs)
 
-    boundary_face_idxs = []
-    for j in boundary_vertex_idxs:
-        for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
-            boundary_face_idxs += [face_adjacency[k]]
-    inner_boundary_face_idxs = np.intersect1d(boundary_face_idxs, sub_face_idxs)
+    boundary_face_mask = morphology.vertex_star(morphology.boundary_vertices(face_set))
+    boundary_face_idxs = np.flatnonzero(boundary_face_mask)
+    inner_boundary_face_idxs = np.flatnonzero(boundary_face_mask & (face_set > 0))
 
     return boundary_face_idxs, inner_boundary_face_idxs
 
@@ -316,7 +638,8 @@ def trim_boundary(faces,
                   sub_face_idxs,
                   face_adjacency,
                   cumulative_sum,
-                  trimming_iteration):
+                  trimming_iteration,
+                  morphology=None):
 
     """
     This function trims the boundary of a sub-region.
@@ -326,14 +649,18 @@ def trim_boundary(faces,
     :param face_adjacency: the face adjacency matrix
     :param cumulative_sum: cumulative sum of "face-vertex visiting procedure" from libigl
     :param trimming_iteration: Number of trimming iterations to perform
+    :param morphology: the FaceSetMorphology of faces (e.g. MeshTopology.morphology), built here when it is not given
 
     :return: list of facet indices corresponding to the trimmed sub-region
     """
-    for i in range(trimming_iteration):
-        b_face_idxs, ib_face_idxs = get_boundary_faces(faces, sub_face_idxs, face_adjacency, cumulative_sum)
-        sub_face_idxs = np.setxor1d(sub_face_idxs, ib_face_idxs)
+    if trimming_iteration == 0:
+        return sub_face_idxs
+
+    if morphology is None:
+        morphology = FaceSetMorphology(faces, face_adjacency, cumulative_sum)
+    trimmed = morphology.erode(morphology.multiplicity(sub_face_idxs), trimming_iteration)
 
-    return sub_face_idxs
+    return np.flatnonzero(trimmed)
 
 
 def get_largest_component(faces,
@@ -358,7 +685,8 @@ def get_largest_component(faces,
 
 
 def remove_ears(faces,
-                sub_face_idxs):
+                sub_face_idxs,
+                max_iteration=100):
 
     """
     This function removes any "ears" of the the sub-region.
@@ -367,23 +695,29 @@ def remove_ears(faces,
 
             ____/\____
 
+    Removing an ear can turn its neighbour into a new ear, so this is repeated until no ears are left.
+
     :param faces: list of faces where the sub-region is a part of
     :param sub_face_idxs: list of facet indices corresponding to the sub-region
+    :param max_iteration: maximum number of removal passes
 
-    :return: list of facet indices corresponding to the sub-region with all the rears removed
+    :return: list of facet indices corresponding to the sub-region with all the rears removed, in their original order
     """
 
-    ears = igl.ears(faces[sub_face_idxs])[0]
-    cleaned_faces = np.delete(faces[sub_face_idxs], ears, axis=0)
-    cleaned_face_idxs = []
-    # TODO: Remove this for loop.
-    for i in range(len(cleaned_faces)):
-        ind = np.where(faces == cleaned_faces[i])[0]
-        m = np.unique(ind, return_counts=True)[1]
-        o = np.where(m == 3)[0][0]
-        cleaned_face_idxs.append(ind[o])
+    cleaned_face_idxs = np.asarray(sub_face_idxs)
+
+    for i in range(max_iteration):
+        if len(cleaned_face_idxs) == 0:
+            break
 
-    return np.array(cleaned_face_idxs)
+        # ears are local indices into the subset, so they can be dropped from the index list directly
+        ears = np.ravel(igl.ears(faces[cleaned_face_idxs])[0])
+        if len(ears) == 0:
+            break
+
+        cleaned_face_idxs = np.delete(cleaned_face_idxs, ears)
+
+    return cleaned_face_idxs
 
 
 def grow_cartilage(faces,
@@ -391,53 +725,39 @@ def grow_cartilage(faces,
                    face_adjacency, cumulative_sum,
                    curvature_value,
                    min_curvature_threshold,
-                   max_curvature_threshold):
+                   max_curvature_threshold,
+                   morphology=None):
 
     """
-    This function grows the sub-region surface based on global curvature values.
-    TODO: Change this to be based on local curvature
+    This function grows the sub-region surface based on curvature values, ring by ring for at most 200 rings.
+    The thresholds are either global (a single value) or local (one value per face, e.g. derived from the curvature
+    around the initial region).
 
     :param faces: list of faces where the sub-region is a part of
     :param sub_face_idxs: list of facet indices corresponding to the sub-region
     :param face_adjacency: the face adjacency matrix
     :param cumulative_sum: cumulative sum of "face-vertex visiting procedure" from libigl
     :param curvature_value: assigned curvature value for for each face
-    :param min_curvature_threshold: minimum curvature threshold for the grown region
-    :param max_curvature_threshold: maximum curvature threshold for the grown region
+    :param min_curvature_threshold: minimum curvature threshold for the grown region, a value or one value per face
+    :param max_curvature_threshold: maximum curvature threshold for the grown region, a value or one value per face
+    :param morphology: the FaceSetMorphology of faces (e.g. MeshTopology.morphology), built here when it is not given
 
     :return: list of facet indices corresponding to the grown sub-region
     """
 
-    pending_face_idxs = sub_face_idxs
-    faces_count = sub_face_idxs.shape[0]
-
-    for n in range(200):
-
-        # b = both side boundary, ib = inner boundary
-        grow_b_face_idxs, grow_ib_face_idxs = get_boundary_faces(faces,
-                                                                 pending_face_idxs,
-                                                                 face_adjacency,
-                                                                 cumulative_sum)
+    if morphology is None:
+        morphology = FaceSetMorphology(faces, face_adjacency, cumulative_sum)
 
-        # ob = the outer boundary
-        grow_ob_face_idxs = np.setxor1d(grow_b_face_idxs, grow_ib_face_idxs)
+    min_curvature_threshold = np.asarray(min_curvature_threshold)
+    max_curvature_threshold = np.asarray(max_curvature_threshold)
 
-        # neighbours with appropriate curvature range
-        grow_measure = np.where(np.logical_and(curvature_value[grow_ob_face_idxs] > min_curvature_threshold,
-                                               curvature_value[grow_ob_face_idxs] < max_curvature_threshold))
-        grow_face_idxs = grow_ob_face_idxs[grow_measure]
+    # neighbours with appropriate curvature range
+    def in_curvature_range(face_idxs):
+        min_value = min_curvature_threshold if min_curvature_threshold.ndim == 0 else min_curvature_threshold[face_idxs]
+        max_value = max_curvature_threshold if max_curvature_threshold.ndim == 0 else max_curvature_threshold[face_idxs]
+        return np.logical_and(curvature_value[face_idxs] > min_value, curvature_value[face_idxs] < max_value)
 
-        # add to the initial sub-region
-        extended_face_idxs = np.concatenate((pending_face_idxs, grow_face_idxs))
-
-        if extended_face_idxs.shape[0] == faces_count:
-            break
-
-        else:
-            pending_face_idxs = extended_face_idxs
-            faces_count = pending_face_idxs.shape[0]
-
-    return extended_face_idxs
+    return morphology.grow(sub_face_idxs, in_curvature_range, 200)
 
 
 def assign_thickness(vertices_p,
@@ -470,20 +790,106 @@ def assign_thickness(vertices_p,
     # plt.hist(sd_value)
     # plt.show()
 
-    minz = (np.min ( sd_value) + np.mean(sd_value) ) /2
-
     # thickness of all the vertices outside the sub-region
     thickness_profile = np.zeros(vertices_p.shape[0])
 
     # thickness of all the vertices inside the sub-region
-    j = 0
-    for i in sub_vertex_idxs:
-        thickness_profile[i] = sd_value[j]
-        j = j + 1
+    thickness_profile[sub_vertex_idxs] = sd_value
 
     return thickness_profile,  np.min ( sd_value)
 
 
+def assign_thickness_variants(vertices_p,
+                              faces_p,
+                              vertices_s,
+                              faces_s,
+                              sub_face_idxs,
+                              thickness_factors):
+
+    """
+    this function assigns the thickness profiles of several thickness factors at once, e.g. the with and without gap
+    variants. The distance to the secondary surface is computed once and scaled by every factor, so more variants
+    (e.g. a sensitivity study) cost next to nothing.
+
+    :param vertices_p: list of vertex positions of the primary surface
+    :param faces_p: list of triangle indices of the primary surface
+    :param vertices_s: list of vertex positions of the secondary surface
+    :param faces_s: list of triangle indices of the secondary surface
+    :param sub_face_idxs: list of facet indices corresponding to the sub-region
+    :param thickness_factors: list of thickness factors, see assign_thickness
+
+    :return: the thickness profiles (one row per factor) and the minimum thickness of each factor
+
+    """
+    sub_vertex_idxs = np.unique(faces_p[sub_face_idxs].flatten())
+    sd_value = igl.signed_distance(vertices_p[sub_vertex_idxs], vertices_s, faces_s, return_normals=False)[0]
+    sd_values = np.outer(np.asarray(thickness_factors, dtype=np.float64), sd_value)
+
+    # thickness of all the vertices outside the sub-region is zero
+    thickness_profiles = np.zeros((len(sd_values), vertices_p.shape[0]))
+    thickness_profiles[:, sub_vertex_idxs] = sd_values
+
+    return thickness_profiles, np.min(sd_values, axis=1)
+
+
+def taper_thickness(thickness_profiles,
+                    minimum_heights,
+                    distance_to_boundary,
+                    bandwidth):
+
+    """
+    this function tapers the thickness profiles towards the boundary: the thickness of every vertex closer than the
+    bandwidth to the boundary is set to minimum_height * sin(distance * pi / (2 * bandwidth)), for all profiles at once
+
+    :param thickness_profiles: thickness profiles, one row per variant, see assign_thickness_variants
+    :param minimum_heights: the minimum thickness of each variant
+    :param distance_to_boundary: geodesic distance of every vertex to the boundary
+    :param bandwidth: width of the tapered band
+
+    :return: the tapered thickness profiles and the indices of the vertices within the band
+    """
+
+    band_vertex_idxs = np.where(distance_to_boundary <= bandwidth)[0]
+    ramp = np.sin(distance_to_boundary[band_vertex_idxs] * np.pi / (2 * bandwidth))
+
+    thickness_profiles = np.array(thickness_profiles, dtype=np.float64)
+    thickness_profiles[:, band_vertex_idxs] = np.outer(minimum_heights, ramp)
+
+    return thickness_profiles, band_vertex_idxs
+
+
+def extrude_cartilage_variants(vertices_p,
+                               faces_p,
+                               sub_face_idxs,
+                               harmonic_weights,
+                               vertex_normals=None):
+
+    """
+    This function extrudes the subset surface once for every row of harmonic weights, see extrude_cartilage. The
+    vertex normals are computed once for all variants.
+
+    :param vertices_p: list of vertex positions of the primary surface
+    :param faces_p: list of triangle indices of the primary surface
+    :param sub_face_idxs: list of facet indices corresponding to the sub-region
+    :param harmonic_weights: harmonic weights of the sub-region vertices, one row per variant (a row may also be a
+    single value for a uniform thickness)
+    :param vertex_normals: the per vertex normals of the primary surface, when they are already known
+
+    :return: extruded subset vertices, one array per variant
+    """
+
+    sub_vertex_idxs = np.unique(faces_p[sub_face_idxs].flatten())
+    if vertex_normals is None:
+        vertex_normals = igl.per_vertex_normals(vertices_p, faces_p)
+    base_vertex_normals = vertex_normals[sub_vertex_idxs]
+
+    extruded_vertices = np.repeat(vertices_p[np.newaxis], len(harmonic_weights), axis=0)
+    harmonic_weights = np.asarray(harmonic_weights, dtype=np.float64).reshape(len(harmonic_weights), -1)
+    extruded_vertices[:, sub_vertex_idxs] += base_vertex_normals * harmonic_weights[:, :, np.newaxis]
+
+    return extruded_vertices
+
+
 def boundary_value(vertices,
                    faces,
                    external_boundary,
@@ -515,10 +921,105 @@ def boundary_value(vertices,
     return weights
 
 
+class HarmonicBlending:
+    """
+    A k-harmonic blending solver that is assembled and factorized once for a mesh and a set of boundary vertices, and
+    then solves for any number of boundary value vectors by back-substitution. It gives the weights of
+    igl.harmonic_weights (as in boundary_value).
+
+    With sub_face_idxs the system only covers the faces of the cartilage region instead of the whole bone. This gives
+    the same weights inside the region as long as every free vertex is at least blending_order rings away from the
+    edge of the region, which the fixed boundary band normally guarantees; otherwise the whole mesh is used. The
+    weights outside the region are zero.
+
+    blending = src.HarmonicBlending(p_vertices, s_faces, boundaries, param.blending_order, s_face_idxs)
+    harmonic_weights_w_gap, harmonic_weights_wo_gap = blending.solve(s_thickness_profiles[:, boundaries])
+    """
+
+    def __init__(self, vertices, faces, boundary, blending_order, sub_face_idxs=None):
+        boundary = np.asarray(boundary, dtype=np.int64)
+        self.n_vertices = len(vertices)
+
+        # a vertex that is listed twice keeps its last value
+        self.boundary, last = np.unique(boundary[::-1], return_index=True)
+        self._value_idxs = len(boundary) - 1 - last
+
+        domain_faces = faces
+        if sub_face_idxs is not None:
+            sub_faces = faces[sub_face_idxs]
+            if self._is_separated(faces, sub_faces, blending_order):
+                domain_faces = sub_faces
+            else:
+                print('free vertices near the edge of the region, blending on the whole mesh')
+        self.restricted = domain_faces is not faces
+
+        self.domain = np.unique(domain_faces.flatten())
+        local_idxs = np.full(self.n_vertices, -1)
+        local_idxs[self.domain] = np.arange(len(self.domain))
+
+        laplacian = igl.cotmatrix(vertices[self.domain], local_idxs[domain_faces])
+        mass = igl.massmatrix(vertices[self.domain], local_idxs[domain_faces], igl.MASSMATRIX_TYPE_VORONOI)
+
+        # Q = (-L) (M^-1 (-L))^(k-1), as igl::harmonic builds it
+        quadratic = -laplacian
+        mass_inverse = sparse.diags(1 / mass.diagonal())
+        for _ in range(blending_order - 1):
+            quadratic = quadratic @ mass_inverse @ -laplacian
+        quadratic = quadratic.tocsr()
+
+        # boundary vertices outside of the region do not take part
+        self._in_domain = local_idxs[self.boundary] >= 0
+        known = local_idxs[self.boundary[self._in_domain]]
+        is_known = np.zeros(len(self.domain), dtype=bool)
+        is_known[known] = True
+        self._known = known
+        self._unknown = np.where(~is_known)[0]
+
+        self._quadratic_uk = quadratic[self._unknown][:, known]
+        self._factor = splu(quadratic[self._unknown][:, self._unknown].tocsc())
+
+    def _is_separated(self, faces, sub_faces, blending_order):
+        # the region gives the whole-mesh solution when no free vertex is within blending_order - 1 rings of its edge
+        n = self.n_vertices
+        edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+        adjacency = sparse.coo_matrix((np.ones(len(edges)), (edges[:, 0], edges[:, 1])), shape=(n, n)).tocsr()
+        adjacency = adjacency + adjacency.T
+
+        near = np.zeros(n, dtype=bool)
+        near[np.unique(igl.boundary_facets(sub_faces).flatten())] = True
+        for _ in range(blending_order - 1):
+            near |= adjacency @ near > 0
+
+        free = np.setdiff1d(np.unique(sub_faces.flatten()), self.boundary)
+
+        return not near[free].any()
+
+    def solve(self, boundary_values):
+        """
+        :param boundary_values: values of the boundary vertices, in the order they were given, or one row of values
+        per variant
+        :return: the weights of all the vertices, one row per variant
+        """
+        boundary_values = np.asarray(boundary_values, dtype=np.float64)
+        values = np.atleast_2d(boundary_values)[:, self._value_idxs]
+
+        known_values = values[:, self._in_domain].T
+        unknown_values = self._factor.solve(-(self._quadratic_uk @ known_values))
+
+        weights = np.zeros((len(values), self.n_vertices))
+        weights[:, self.domain[self._known]] = known_values.T
+        weights[:, self.domain[self._unknown]] = unknown_values.T
+        # boundary vertices outside of the region keep their value
+        weights[:, self.boundary[~self._in_domain]] = values[:, ~self._in_domain]
+
+        return weights if boundary_values.ndim > 1 else weights[0]
+
+
 def extrude_cartilage(vertices_p,
                       faces_p,
                       sub_face_idxs,
-                      harmonic_weights):
+                      harmonic_weights,
+                      vertex_normals=None):
 
     """
     This function extrudes the subset surface based on harmonic weights.
@@ -527,52 +1028,33 @@ def extrude_cartilage(vertices_p,
     :param faces_p: list of triangle indices of the primary surface
     :param sub_face_idxs: list of facet indices corresponding to the sub-region
     :param harmonic_weights: The harmonic weights computed by 'boundary_value'
+    :param vertex_normals: the per vertex normals of the primary surface, when they are already known
 
     :return: extruded subset vertices
     """
 
-    sub_vertex_idxs = np.unique(faces_p[sub_face_idxs].flatten())
-    vertex_normals = igl.per_vertex_normals(vertices_p, faces_p)
-    base_vertex_normals = vertex_normals[sub_vertex_idxs]
-
-    thickness = []
-    for i in range(len(sub_vertex_idxs)):
-        thickness.append(base_vertex_normals [i] * harmonic_weights[i])
-
-    extruded_vertices = np.copy(vertices_p)
-    extruded_vertices[sub_vertex_idxs] = vertices_p[sub_vertex_idxs] + thickness
-
-    return extruded_vertices
+    return extrude_cartilage_variants(vertices_p, faces_p, sub_face_idxs, [harmonic_weights], vertex_normals)[0]
 
 
 def extrude_uniform(vertices_p,
                     faces_p,
                     sub_face_idxs,
-                    uniform_thickness):
+                    uniform_thickness,
+                    vertex_normals=None):
 
     """
-    This function extrudes the subset surface based on harmonic weights.
+    This function extrudes the subset surface by a uniform thickness.
 
     :param vertices_p: list of vertex positions of the primary surface
     :param faces_p: list of triangle indices of the primary surface
     :param sub_face_idxs: list of facet indices corresponding to the sub-region
-    :param uniform_thickness:
+    :param uniform_thickness: the thickness of every vertex of the sub-region
+    :param vertex_normals: the per vertex normals of the primary surface, when they are already known
 
     :return: extruded subset vertices
     """
 
-    sub_vertex_idxs = np.unique(faces_p[sub_face_idxs].flatten())
-    vertex_normals = igl.per_vertex_normals(vertices_p, faces_p)
-    base_vertex_normals = vertex_normals[sub_vertex_idxs]
-
-    thickness = []
-    for i in range(len(sub_vertex_idxs)):
-        thickness.append(base_vertex_normals [i] * uniform_thickness)
-
-    extruded_vertices = np.copy(vertices_p)
-    extruded_vertices[sub_vertex_idxs] = vertices_p[sub_vertex_idxs] + thickness
-
-    return extruded_vertices
+    return extrude_cartilage_variants(vertices_p, faces_p, sub_face_idxs, [uniform_thickness], vertex_normals)[0]
 
 
 def norm_visualization(vertices, faces):
@@ -625,44 +1107,117 @@ def smooth_and_separate_boundaries(vertices,
                                    vertices_b,
                                    faces_p,
                                    smoothing_factor,
-                                   smoothing_iteration):
+                                   smoothing_iteration,
+                                   fixed_vertex_idxs=None,
+                                   snap=False):
 
     """
     This function smooths the subset boundaries and ensures no penetration to the underlying surface.
 
     :param vertices: list of vertex positions
     :param boundary_edges: list of the boundary edge indices
-    :param vertices_b:
-    :param faces_p:
+    :param vertices_b: list of vertex positions of the bone
+    :param faces_p: list of triangle indices of the bone
     :param smoothing_factor:
     :param smoothing_iteration: number of smoothing iterations to perform
+    :param fixed_vertex_idxs: list of boundary vertex indices that keep their position
+    :param snap: project the boundary back onto the bone after every iteration
 
     :return: list of separated, smooth and non-penetrating vertices
         
     """
 
-    # determine and smooth first boundary
-    boundary_1 = igl.edges_to_path(boundary_edges)[0]
+    # determine all the boundaries and smooth them together
+    smoothing = BoundarySmoothing(boundary_paths(boundary_edges), smoothing_factor, fixed_vertex_idxs)
+
+    if snap:
+        return smoothing.smooth(vertices, smoothing_iteration, vertices_b, faces_p)
+
+    return smoothing.smooth(vertices, smoothing_iteration)
+
 
-    for i in range(smoothing_iteration):
-        vertices = smooth_boundary(vertices, boundary_1, smoothing_factor)
-        # vertices = snap_to_surface(vertices, vertices_b, faces_p)
+def boundary_paths(boundary_edges):
+
+    """
+    This function splits boundary edges into their loops, each one as igl.edges_to_path orders it (closed, the first
+    vertex repeated at the end).
+
+    :param boundary_edges: list of the boundary edge indices, e.g. from igl.boundary_facets
+    :return: list of vertex index paths, one per loop
+    """
 
-    # determine if we have more boundaries and smooth them
-    boundary_1_idxs = []
-    for j in boundary_1:
-        idx = np.where(boundary_edges == j)[0]
-        boundary_1_idxs.append(idx)
-    boundary_2_idxs = np.delete(boundary_edges, boundary_1_idxs, axis=0)
+    paths = []
+    remaining_edges = np.asarray(boundary_edges)
+
+    while len(remaining_edges) != 0:
+        path = igl.edges_to_path(remaining_edges)[0]
+        paths.append(path)
+
+        # drop the edges of this loop and look for the next one
+        remaining_edges = remaining_edges[~np.any(np.isin(remaining_edges, path), axis=1)]
+
+    return paths
+
+
+class BoundarySmoothing:
+    """
+    Laplacian smoothing of boundary curves. Each vertex of a path moves towards the middle of its two neighbours on the
+    path (the path is closed: the first and last vertex are neighbours). The averaging of all paths is one sparse
+    matrix over the path vertices, so an iteration is a single mat-vec however many loops there are. The paths should
+    not share vertices; a vertex listed twice in a path takes the neighbours of its last occurrence.
+
+    smoothing = src.BoundarySmoothing(src.boundary_paths(boundary_edges), param.smoothing_factor)
+    p_vertices = smoothing.smooth(p_vertices, param.smoothing_iteration_base, pb_vertices, pb_faces)
+    """
 
-    if len(boundary_2_idxs) != 0:
-        boundary_2 = igl.edges_to_path(boundary_2_idxs)[0]
+    def __init__(self, paths, smoothing_factor, fixed_vertex_idxs=None):
+        paths = [np.asarray(path, dtype=np.int64).ravel() for path in paths if len(path) != 0]
+        path_vertex_idxs = np.concatenate(paths) if len(paths) != 0 else np.zeros(0, dtype=np.int64)
+        previous_idxs = np.concatenate([np.roll(path, 1) for path in paths]) if len(paths) != 0 else path_vertex_idxs
+        next_idxs = np.concatenate([np.roll(path, -1) for path in paths]) if len(paths) != 0 else path_vertex_idxs
 
+        # the last occurrence of every vertex sets its neighbours
+        self.vertex_idxs, last = np.unique(path_vertex_idxs[::-1], return_index=True)
+        last = len(path_vertex_idxs) - 1 - last
+        n = len(self.vertex_idxs)
+
+        rows = np.arange(n)
+        previous_cols = np.searchsorted(self.vertex_idxs, previous_idxs[last])
+        next_cols = np.searchsorted(self.vertex_idxs, next_idxs[last])
+
+        # fixed vertices average to themselves
+        fixed = np.zeros(n, dtype=bool)
+        if fixed_vertex_idxs is not None:
+            fixed = np.isin(self.vertex_idxs, fixed_vertex_idxs)
+        previous_cols[fixed] = rows[fixed]
+        next_cols[fixed] = rows[fixed]
+
+        self.smoothing_factor = smoothing_factor
+        self.average = sparse.csr_matrix((np.full(2 * n, 0.5), (np.concatenate((rows, rows)),
+                                                                 np.concatenate((previous_cols, next_cols)))),
+                                         shape=(n, n))
+
+    def smooth(self, vertices, smoothing_iteration=1, vertices_b=None, faces_b=None):
+        """
+        :param vertices: list of vertex positions, the path vertices are updated in place
+        :param smoothing_iteration: number of smoothing iterations to perform
+        :param vertices_b: list of vertex positions of the surface to project the paths onto after each iteration
+        :param faces_b: list of triangle indices of that surface
+        :return: the smoothed vertices
+        """
+
+        positions = vertices[self.vertex_idxs]
         for i in range(smoothing_iteration):
-            vertices = smooth_boundary(vertices, boundary_2, smoothing_factor)
-            # vertices = snap_to_surface(vertices, vertices_b, faces_p)
+            delta = self.average @ positions - positions
+            positions = positions + self.smoothing_factor * delta
+
+            # the closest points on the surface, igl rebuilds its tree on every call (the bindings do not expose it)
+            if vertices_b is not None:
+                positions = igl.signed_distance(positions, vertices_b, faces_b, return_normals=False)[2]
 
-    return vertices
+        vertices[self.vertex_idxs] = positions
+
+        return vertices
 
 
 def smooth_boundary(vertices, b_idxs, smoothing_factor):
@@ -676,26 +1231,11 @@ def smooth_boundary(vertices, b_idxs, smoothing_factor):
 
     :return: list of smooth and non-penetrating vertices
     """
-    # add the last vertex idxs to the beginning and the first index to the end
-    b_idxs = np.insert(b_idxs, 0, b_idxs[-1])
-    b_idxs = np.insert(b_idxs, len(b_idxs), b_idxs[1])
-    
-    # new vertices
-    new_vertices = np.zeros((len(b_idxs) - 2, 3))
-    
-    # loop through all boundary vertices and apply smoothing
-    for i in range(1, len(b_idxs) - 1):
-        
-        delta = 0.5 * ( vertices[ b_idxs[i - 1] ] + vertices[ b_idxs[i + 1] ] ) - vertices[ b_idxs[i] ]
-        
-        new_vertices[i - 1] = vertices[b_idxs[i]] + smoothing_factor * delta
-
-    vertices[b_idxs[1: -1]] = new_vertices
 
-    return vertices
+    return BoundarySmoothing([b_idxs], smoothing_factor).smooth(vertices)
 
 
-def save_surface(vertices, faces, output_dim, path):
+def save_surface(vertices, faces, output_dim, path, writer=None, vertex_attributes=None, float32=False):
 
     """
     This function saves a surface mesh (obj file format) of the generated model
@@ -703,14 +1243,204 @@ def save_surface(vertices, faces, output_dim, path):
     :param vertices: list of vertex positions
     :param faces: list of the triangle faces
     :param output_dim: output dimension
-    :param path: The path where the file should be saved at.
+    :param path: The path where the file should be saved at. A '.ply' path is written as binary ply.
+    :param writer: optional OutputWriter, the file is then written in the background
+    :param vertex_attributes: ply only, dictionary of name -> per-vertex values, e.g. the thickness profile
+    :param float32: ply only, store the coordinates as float32
 
     """
 
     if output_dim == "m":
         vertices = vertices / 1000
 
-    igl.write_triangle_mesh(path, vertices, faces)
+    if str(path).lower().endswith('.ply'):
+        submit_or_write(writer, atomic_write, write_ply, path, vertices, faces,
+                        vertex_attributes=vertex_attributes, float32=float32)
+    else:
+        submit_or_write(writer, atomic_write, igl.write_triangle_mesh, path, vertices, faces)
+
+
+ply_types = {'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+             'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+             'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+             'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'}
+
+ply_names = {'i1': 'char', 'u1': 'uchar', 'i2': 'short', 'u2': 'ushort',
+             'i4': 'int', 'u4': 'uint', 'f4': 'float', 'f8': 'double'}
+
+
+def _ply_columns(attributes):
+
+    """
+    This function flattens a dictionary of attribute arrays into ply properties: a (n,) array is one property,
+    a (n, k) array becomes the properties name_0 ... name_k-1. Integers keep their type, ply has no 64 bit integers,
+    so those are stored as int or uint when the values fit and refused otherwise.
+
+    :param attributes: dictionary of name -> array
+    :return: list of (property name, dtype, values)
+    """
+
+    columns = []
+
+    for name, values in (attributes or {}).items():
+        values = np.asarray(values)
+        if values.dtype == np.float32:
+            dtype = np.dtype('<f4')
+        elif values.dtype.kind == 'b':
+            dtype = np.dtype('<u1')
+        elif values.dtype.kind in 'iu' and values.dtype.itemsize <= 4:
+            dtype = values.dtype.newbyteorder('<')
+        elif values.dtype.kind in 'iu':
+            if values.size == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+                dtype = np.dtype('<i4')
+            elif values.min() >= 0 and values.max() <= np.iinfo(np.uint32).max:
+                dtype = np.dtype('<u4')
+            else:
+                raise ValueError("the values of " + name + " do not fit in a 32 bit ply property")
+        else:
+            dtype = np.dtype('<f8')
+        if values.ndim == 1:
+            columns.append((name, dtype, values))
+        else:
+            for k in range(values.shape[1]):
+                columns.append((name + '_' + str(k), dtype, values[:, k]))
+
+    return columns
+
+
+def write_ply(path, vertices, faces, vertex_attributes=None, face_attributes=None, float32=False):
+
+    """
+    This function writes a triangle mesh as binary (little endian) ply, together with named per-vertex and per-face
+    values
+
+    :param path: the path of the ply file
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    :param vertex_attributes: dictionary of name -> per-vertex values, e.g. {'thickness': thickness_profile}
+    :param face_attributes: dictionary of name -> per-face values
+    :param float32: store the coordinates as float32 instead of float64
+
+    """
+
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces)
+    coordinate_type = np.dtype('<f4') if float32 else np.dtype('<f8')
+
+    vertex_columns = [('x', coordinate_type, vertices[:, 0]),
+                      ('y', coordinate_type, vertices[:, 1]),
+                      ('z', coordinate_type, vertices[:, 2])] + _ply_columns(vertex_attributes)
+    face_columns = _ply_columns(face_attributes)
+
+    vertex_data = np.empty(len(vertices), dtype=[(name, dtype) for name, dtype, _ in vertex_columns])
+    for name, _, values in vertex_columns:
+        vertex_data[name] = values
+
+    face_data = np.empty(len(faces), dtype=[('count', 'u1'), ('vertex_indices', '<i4', (3,))] +
+                                           [(name, dtype) for name, dtype, _ in face_columns])
+    face_data['count'] = 3
+    face_data['vertex_indices'] = faces
+    for name, _, values in face_columns:
+        face_data[name] = values
+
+    header = ['ply', 'format binary_little_endian 1.0', 'element vertex ' + str(len(vertices))]
+    header += ['property ' + ply_names[dtype.str[1:]] + ' ' + name for name, dtype, _ in vertex_columns]
+    header += ['element face ' + str(len(faces)), 'property list uchar int vertex_indices']
+    header += ['property ' + ply_names[dtype.str[1:]] + ' ' + name for name, dtype, _ in face_columns]
+    header += ['end_header']
+
+    with open(path, 'wb') as ply_file:
+        ply_file.write(('\n'.join(header) + '\n').encode('ascii'))
+        vertex_data.tofile(ply_file)
+        face_data.tofile(ply_file)
+
+
+def read_ply(path, dtype=np.float64):
+
+    """
+    This function reads a triangle mesh from a ply file (binary or ascii) with all of its per-vertex and per-face
+    properties
+
+    :param path: the path of the ply file
+    :param dtype: the type of the returned vertex positions
+
+    :return: the vertices, the faces, a dictionary of per-vertex values and a dictionary of per-face values
+    """
+
+    with open(path, 'rb') as ply_file:
+
+        if ply_file.readline().strip() != b'ply':
+            raise ValueError("not a ply file: " + str(path))
+
+        file_format = None
+        elements = []
+        while True:
+            line = ply_file.readline()
+            if not line:
+                raise ValueError("ply header without end_header: " + str(path))
+            words = line.decode('ascii').split()
+            if not words or words[0] in ('comment', 'obj_info'):
+                continue
+            if words[0] == 'end_header':
+                break
+            if words[0] == 'format':
+                file_format = words[1]
+            elif words[0] == 'element':
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == 'property':
+                if words[1] == 'list':
+                    elements[-1][2].append((words[4], 'list', (ply_types[words[2]], ply_types[words[3]])))
+                else:
+                    elements[-1][2].append((words[2], ply_types[words[1]], None))
+
+        byte_order = {'binary_little_endian': '<', 'binary_big_endian': '>', 'ascii': '<'}[file_format]
+
+        data = {}
+        for element_name, count, properties in elements:
+            fields = []
+            widths = []
+            for name, type_name, list_types in properties:
+                if type_name == 'list':
+                    # only triangle lists are read in bulk
+                    fields += [(name + '_count', byte_order + list_types[0]), (name, byte_order + list_types[1], (3,))]
+                    widths += [1, 3]
+                else:
+                    fields.append((name, byte_order + type_name))
+                    widths.append(1)
+            if file_format == 'ascii':
+                if count == 0:
+                    rows = np.zeros((0, len(fields)))
+                else:
+                    lines = b''.join(ply_file.readline() for _ in range(count))
+                    rows = np.loadtxt(lines.decode('ascii').splitlines(), ndmin=2)
+                values = np.empty(count, dtype=fields)
+                column = 0
+                for field, width in zip(fields, widths):
+                    values[field[0]] = rows[:, column:column + width].reshape(values[field[0]].shape)
+                    column += width
+            else:
+                values = np.fromfile(ply_file, dtype=fields, count=count)
+            for name, type_name, _ in properties:
+                if type_name == 'list' and np.any(values[name + '_count'] != 3):
+                    raise ValueError("only triangle meshes are supported: " + str(path))
+            data[element_name] = (values, properties)
+
+    vertex_values, vertex_properties = data['vertex']
+    vertices = np.column_stack((vertex_values['x'], vertex_values['y'], vertex_values['z'])).astype(dtype)
+    vertex_attributes = {name: vertex_values[name] for name, type_name, _ in vertex_properties
+                         if name not in ('x', 'y', 'z') and type_name != 'list'}
+
+    faces = np.zeros((0, 3), dtype=np.int64)
+    face_attributes = {}
+    if 'face' in data:
+        face_values, face_properties = data['face']
+        for name, type_name, _ in face_properties:
+            if type_name == 'list':
+                faces = face_values[name].astype(np.int64)
+            else:
+                face_attributes[name] = face_values[name]
+
+    return vertices, faces, vertex_attributes, face_attributes
 
 
 def get_area(vertices, faces):
@@ -724,15 +1454,7 @@ def get_area(vertices, faces):
     :return: the surface area of the input triangles
     """
 
-    surface_area = 0
-    for i in range(len(faces)):
-        u = vertices[faces[i, 1]] - vertices[faces[i, 0]]
-        v = vertices[faces[i, 2]] - vertices[faces[i, 0]]
-        n = np.cross(u, v)
-        mag = np.linalg.norm(n, axis=0)
-        mag = mag / 2
-
-        surface_area += mag
+    surface_area = np.sum(face_areas(vertices, faces))
 
     return surface_area
 
@@ -837,7 +1559,7 @@ def refine_secondary_bone (vertices_p,
     :param faces_b:
     :return:
     """
-    face_adjacency, cumulative_sum = igl.vertex_triangle_adjacency(faces_s, len(vertices_s))
+    s_topology = MeshTopology(vertices_s, faces_s)
 
     # find a subset:
     face_idxs = get_initial_surface(vertices_s, faces_s,  vertices_b, faces_b, 10)
@@ -866,10 +1588,7 @@ def refine_secondary_bone (vertices_p,
     #
     vertex_idxs = subset_vertex_idxs[index_list]
     #
-    s_face_idxs = []
-    for j in vertex_idxs:
-        for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
-            s_face_idxs += [face_adjacency[k]]
+    s_face_idxs = s_topology.vertex_star(vertex_idxs)
 
     frame = mp.plot(vertices_s, faces_s, c=bone, shading=sh_true)
     frame.add_points(vertices_p[ex_base_b_vertex_idxs], shading={"point_color": "green", "point_size": 3})
@@ -920,29 +1639,21 @@ def contact_surface(vertices_1,
     :param faces_2:
     :param epsilon:
 
+    :return: the contact surface area
     """
 
-    # triangle centroids
-    triangle_centroids = igl.barycenter(vertices_1, faces_1)
-
-    # point to surface distance
-    sd_value, _, _ = igl.signed_distance(triangle_centroids,
-                                         vertices_2,
-                                         faces_2,
-                                         return_normals=False)
+    # faces below a distance threshold, see contact_area for the measurement without plotting
+    area, contact_face_idxs, min_sd_value = contact_area(vertices_1, faces_1, vertices_2, faces_2, epsilon)
 
-    print('min:', np.min(sd_value))
-
-    # faces below a distance threshold
-    contact_face_idxs = np.where(sd_value <= epsilon)[0]
+    print('min:', min_sd_value)
 
     # viz
     frame = mp.plot(vertices_1, faces_1, c=bone, shading=sh_false)
     frame.add_mesh(vertices_1, faces_1[contact_face_idxs], c=organ, shading=sh_true)
 
-    contact_area = get_area(vertices_1, faces_1[contact_face_idxs])
+    print("contact surface area is: ", np.round(area, 2))
 
-    print("contact surface area is: ", np.round(contact_area, 2))
+    return area
 
 
 def neighbouring_info(vertices, faces):
@@ -958,22 +1669,16 @@ def neighbouring_info(vertices, faces):
     """
 
     # adjacency info
-    face_adjacency, cumulative_sum = igl.vertex_triangle_adjacency(faces, len(vertices))
+    topology = MeshTopology(vertices, faces)
 
     # part.1 boundary vertex indices
     boundary_vertex_idxs = igl.boundary_loop(faces)
 
     # part.2 neighboring faces to these vertices
-    boundary_face_idxs = []
-    container = []
-    for j in boundary_vertex_idxs:
-        for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
-            container += [face_adjacency[k]]
-        boundary_face_idxs.append(container)
-        container = []
+    boundary_face_idxs = [star.tolist() for star in topology.vertex_stars(boundary_vertex_idxs)]
 
     # part.3 find the face neighbors to these faces
-    tt_info = igl.triangle_triangle_adjacency(faces)[0]
+    tt_info = topology.triangle_adjacency[0]
 
     container = []
     neigh_face_list = []
@@ -1002,32 +1707,20 @@ def get_dihedral_angle (vertices, faces, face_idxs, neigh_face_list ):
     # face normals
     face_normals = igl.per_face_normals(vertices, faces[face_idxs], np.array([1., 1., 1.]))
 
-    # measure dihedral angles
-    container = []
-    angles = []
-
-    for i in neigh_face_list:
-        # make all possible pairs
-        pairs = []
-        for j in range(len(i)):
-            for k in range(len(i)):
-                a = [i[j], i[k]]
-                pairs.append(a)
-        pairs = np.array(pairs)
-
-        # find the dihedral angle of each pair
-        for l in pairs:
-            cos = np.dot(face_normals[l[0]], face_normals[l[1]])
-            cos = np.clip(cos, -1, 1)
-            container.append(np.arccos(cos))
-        angles.append(container)
-        container = []
+    # the neighbour lists padded to one table, -1 marks the padding
+    lengths = np.array([len(i) for i in neigh_face_list], dtype=np.int64)
+    width = max(int(np.max(lengths, initial=0)), 1)
+    padded = np.arange(width) < lengths[:, np.newaxis]
+    neighbours = np.zeros((len(neigh_face_list), width), dtype=np.int64)
+    if len(neigh_face_list) != 0:
+        neighbours[padded] = np.concatenate([np.asarray(i, dtype=np.int64) for i in neigh_face_list])
 
-    max_angles = []
-    for i in angles:
-        container = np.max(i)
-        max_angles.append(container)
-        container = []
+    # cosine of every pair of neighbours, the largest angle is the one of the smallest cosine
+    normals = face_normals[neighbours]
+    cos = np.einsum('gki,gli->gkl', normals, normals)
+    cos[~(padded[:, :, np.newaxis] & padded[:, np.newaxis, :])] = 1
+
+    max_angles = np.arccos(np.clip(np.min(cos, axis=(1, 2)), -1, 1))
 
     return max_angles
 
@@ -1046,15 +1739,10 @@ def fix_boundary(vertices, faces, face_idxs, boundary_vertex_idxs, folded_vertex
     """
 
     # adjacency info
-    face_adjacency, cumulative_sum = igl.vertex_triangle_adjacency(faces[face_idxs], len(vertices))
+    topology = MeshTopology(vertices, faces[face_idxs])
 
-    container = []
-    per_vertex_neighbour_face_idxs = []
-    for i in boundary_vertex_idxs[folded_vertex_idxs]:
-        for k in range(cumulative_sum[i], cumulative_sum[i + 1]):
-            container += [face_adjacency[k]]
-        per_vertex_neighbour_face_idxs.append(container)
-        container = []
+    per_vertex_neighbour_face_idxs = [star.tolist() for star in
+                                      topology.vertex_stars(boundary_vertex_idxs[folded_vertex_idxs])]
 
     all_neighbour_face_idxs = []
     for i in per_vertex_neighbour_face_idxs:
@@ -1110,8 +1798,9 @@ def fit_cylinder (vertices_p, faces_p, base_face_idxs):
 
     # extrude positive
 
-    fovea_top_vertices = extrude_uniform(vertices_p, faces_p, fovea_face_idxs, 2)
-    fovea_bottom_vertices = extrude_uniform(vertices_p, faces_p, fovea_face_idxs, -2)
+    vertex_normals = igl.per_vertex_normals(vertices_p, faces_p)
+    fovea_top_vertices = extrude_uniform(vertices_p, faces_p, fovea_face_idxs, 2, vertex_normals)
+    fovea_bottom_vertices = extrude_uniform(vertices_p, faces_p, fovea_face_idxs, -2, vertex_normals)
 
 
     # build wall
@@ -1492,7 +2181,7 @@ def get_wall_sweep(t_vertices, t_faces, b_vertices, b_faces):
     return all_vertices, face_list
 
 
-def gap_fill(vertices_s, b1_faces, surface_face_idxs, face_idxs, cumulative_sum):
+def gap_fill(vertices_s, b1_faces, surface_face_idxs, face_idxs, cumulative_sum, morphology=None):
 
     """
     This function...
@@ -1502,45 +2191,38 @@ def gap_fill(vertices_s, b1_faces, surface_face_idxs, face_idxs, cumulative_sum)
     :param surface_face_idxs:
     :param face_idxs:
     :param cumulative_sum:
+    :param morphology: the FaceSetMorphology of b1_faces (e.g. MeshTopology.morphology), built here when it is not given
     :return:
     """
 
-    gap_boundary_vertex_idxs = [2]
-    l = igl.boundary_loop(b1_faces[surface_face_idxs])
+    if morphology is None:
+        morphology = FaceSetMorphology(b1_faces, face_idxs, cumulative_sum)
 
     # frame = mp.plot(vertices_s, b1_faces, c=bone, shading=sh_false)
     # frame.add_mesh(vertices_s, b1_faces[surface_face_idxs], c=pastel_blue, shading=sh_true)
-    # frame.add_points(vertices_s[l], shading={"point_size": 5, "point_color": "red"})
 
-    while len(gap_boundary_vertex_idxs) != 0:
+    while True:
 
-        # lines creating the edge [v1 v2]
-        edgeline_vertex_idxs = igl.boundary_facets(b1_faces[surface_face_idxs])
+        face_set = morphology.multiplicity(surface_face_idxs)
 
         # boundary vertices
-        all_boundary_vertex_idxs = edgeline_vertex_idxs.flatten()
+        all_boundary_vertex_mask = morphology.boundary_vertices(face_set)
 
         # select the outer loop
         l = igl.boundary_loop(b1_faces[surface_face_idxs])
-        # print(l)
+
         # separate the outer boundary
-        gap_boundary_vertex_idxs = np.setxor1d(all_boundary_vertex_idxs, l)
+        gap_boundary_vertex_mask = np.copy(all_boundary_vertex_mask)
+        gap_boundary_vertex_mask[l] = ~gap_boundary_vertex_mask[l]
 
-        if len(gap_boundary_vertex_idxs) == 0:
+        if not gap_boundary_vertex_mask.any():
             break
 
-        # both-side boundary face
-        boundary_face_idxs = []
-
-        for j in gap_boundary_vertex_idxs:
-            for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
-                boundary_face_idxs += [face_idxs[k]]
+        # choose the outer boundary layer around the holes
+        ob_face_idxs = np.flatnonzero(morphology.vertex_star(gap_boundary_vertex_mask) & (face_set == 0))
 
-        # inner layer of the boundary faces
-        inner_boundary_face_idxs = np.intersect1d(boundary_face_idxs, surface_face_idxs)
-
-        # choose the outer boundary layer
-        ob_face_idxs = np.setxor1d(boundary_face_idxs, inner_boundary_face_idxs)
+        if len(ob_face_idxs) == 0:
+            break
 
         # merge with the rest
         surface_face_idxs = np.concatenate((surface_face_idxs, ob_face_idxs))
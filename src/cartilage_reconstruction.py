@@ -27,10 +27,10 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
     # primary interface vertices
     p_vertices = np.copy(pb_vertices)
     p_faces = np.copy(pb_faces)
-    p_vertex_idxs = np.unique(p_faces.flatten())
 
     # bone adjacency faces
-    face_adjacency, cumulative_sum = igl.vertex_triangle_adjacency(p_faces, len(p_vertices))
+    p_topology = src.MeshTopology(p_vertices, p_faces)
+    face_adjacency, cumulative_sum = p_topology.vertex_faces
 
     # initial primary interface estimation
     int_p_face_idxs, minimum_dist = src.get_initial_surface(p_vertices,
@@ -45,7 +45,8 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
                                              int_p_face_idxs,
                                              face_adjacency,
                                              cumulative_sum,
-                                             param.trimming_iteration)
+                                             param.trimming_iteration,
+                                             morphology=p_topology.morphology)
     else:
         trim_p_face_idxs = np.copy(int_p_face_idxs)
 
@@ -54,9 +55,7 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
 
     # remove ears
     ear_p_face_idxs = np.copy(one_p_face_idxs)
-
-    for i in range(15):
-        ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs)
+    ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs, 15)
 
     # viz
     frame = mp.plot(p_vertices, p_faces, c=src.bone, shading=src.sh_false)
@@ -64,7 +63,7 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
 
     # the base of the Acetabular cartilage, referred to as $\F_{C}^{D}$ in the manuscript
     p_face_idxs = np.copy(ear_p_face_idxs)
-    boundary_edges = igl.boundary_facets(p_faces[p_face_idxs])
+    boundary_edges = p_topology.boundary_edges(p_face_idxs)
 
     # separate and smooth
     if param.smoothing_iteration_base != 0:
@@ -89,11 +88,13 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
     s_face_idxs = np.copy (p_face_idxs)
     s_vertex_idxs = np.unique(s_faces[s_face_idxs].flatten())
 
-    s_edge_vertex_idxs = igl.boundary_facets(s_faces[s_face_idxs])
-    s_edge_vertex_idxs = np.unique(s_edge_vertex_idxs.flatten())
+    # s_faces is a copy of p_faces, so the subset boundary is the one of the primary topology
+    s_edge_vertex_idxs = p_topology.boundary_vertices(s_face_idxs)
 
-    # geodesic distance from all the points on the primary bone to the boundary of the secondary interface
-    dist_to_s_boundary= igl.exact_geodesic(p_vertices, s_faces, s_edge_vertex_idxs, p_vertex_idxs)
+    # geodesic distance from the points of the secondary interface to its boundary, only as far as the taper reaches
+    # (inf beyond the bandwidth), exact for a small band and the heat method for a large one
+    s_geodesic = src.PatchGeodesic(p_vertices, s_faces, s_face_idxs, s_edge_vertex_idxs, param.bandwidth)
+    dist_to_s_boundary = s_geodesic.distance()
 
     # select the first subset of the secondary interface $\F_{C}^{D}$ to extrude
     if param.no_extend_trimming_iteration != 0:
@@ -101,63 +102,44 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
                                          s_face_idxs,
                                          face_adjacency,
                                          cumulative_sum,
-                                         param.no_extend_trimming_iteration)
+                                         param.no_extend_trimming_iteration,
+                                         morphology=p_topology.morphology)
     else:
         int_s1_face_idxs = np.copy(s_face_idxs)
 
     # remove ears
     ear_s1_face_idxs = np.copy(int_s1_face_idxs)
-    for i in range(15):
-        ear_s1_face_idxs = src.remove_ears(s_faces, ear_s1_face_idxs)
+    ear_s1_face_idxs = src.remove_ears(s_faces, ear_s1_face_idxs, 15)
 
     s1_face_idxs = np.copy (ear_s1_face_idxs)
 
-    # assign a thickness profile to the first subset (s1)
-    # with gap
-    s_thickness_profile_w_gap, s_minimum_height_w_gap = src.assign_thickness(p_vertices,
-                                                                             p_faces,
-                                                                             sb_vertices,
-                                                                             sb_faces,
-                                                                             s_face_idxs,
-                                                                             param.w_gap_thickness_factor)
-
-    # without gap
-    s_thickness_profile_wo_gap, s_minimum_height_wo_gap = src.assign_thickness(p_vertices,
-                                                                               p_faces,
-                                                                               sb_vertices,
-                                                                               sb_faces,
-                                                                               s_face_idxs,
-                                                                               param.wo_gap_thickness_factor)
+    # assign a thickness profile to the first subset (s1), with and without gap at once
+    thickness_factors = [param.w_gap_thickness_factor, param.wo_gap_thickness_factor]
+    s_thickness_profiles, s_minimum_heights = src.assign_thickness_variants(p_vertices,
+                                                                            p_faces,
+                                                                            sb_vertices,
+                                                                            sb_faces,
+                                                                            s_face_idxs,
+                                                                            thickness_factors)
+
+    # the maximum thickness allowed is the thickness before tapering (s_faces is a copy of p_faces)
+    s_maximum_thickness_allowed = np.max(s_thickness_profiles, axis=1)
+    s_minimum_height_w_gap, s_minimum_height_wo_gap = s_minimum_heights
 
     print('minimum thickness in the initial layer with gap', np.round(s_minimum_height_w_gap, 5))
     print('minimum thickness in the initial layer without gap', np.round(s_minimum_height_wo_gap, 5))
 
     # select the second subset of the secondary interface (s2)) and extrude
-    # w_gap
-    s2_w_gap_vertex_idxs = []
-    for count, value in enumerate(dist_to_s_boundary):
-        if value <= param.bandwidth:
-            s_thickness_profile_w_gap[count] = s_minimum_height_w_gap * np.sin(value * np.pi / (2 * param.bandwidth))
-            s2_w_gap_vertex_idxs.append(count)
-
-    s2_w_gap_vertex_idxs = np.intersect1d(s_vertex_idxs, np.array(s2_w_gap_vertex_idxs))
-
-    # find the corresponding faces of these vertices
-    s2_w_gap_face_idxs = []
-    for j in s2_w_gap_vertex_idxs:
-        for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
-            s2_w_gap_face_idxs += [face_adjacency[k]]
-
-    s2_w_gap_face_idxs = np.intersect1d(s_face_idxs, np.array(s2_w_gap_face_idxs))
+    s_thickness_profiles, s2_vertex_idxs = src.taper_thickness(s_thickness_profiles,
+                                                               s_minimum_heights,
+                                                               dist_to_s_boundary,
+                                                               param.bandwidth)
 
-    # wo_gap
-    s2_wo_gap_vertex_idxs = []
-    for count, value in enumerate(dist_to_s_boundary):
-        if value <= param.bandwidth:
-            s_thickness_profile_wo_gap[count] = s_minimum_height_wo_gap * np.sin(value * np.pi / (2 * param.bandwidth))
-            s2_wo_gap_vertex_idxs.append(count)
+    # the band does not depend on the thickness factor, both variants share it
+    s2_w_gap_vertex_idxs = np.intersect1d(s_vertex_idxs, s2_vertex_idxs)
 
-    s2_wo_gap_vertex_idxs = np.intersect1d(s_vertex_idxs, np.array(s2_wo_gap_vertex_idxs))
+    # find the corresponding faces of these vertices (s_faces is a copy of p_faces)
+    s2_w_gap_face_idxs = np.intersect1d(s_face_idxs, p_topology.vertex_star(s2_w_gap_vertex_idxs))
 
     " Step C. closed the cartilage using Harmonic boundary blending "
 
@@ -169,55 +151,25 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
     internal_vertex_idxs = np.unique(s_faces[s1_face_idxs].flatten())
 
     # we compute a blended extrusion on the remaining of $\faces_{C}^{E}$ which we did not initially select for extrusion
-    # with gap
-    harmonic_weights_w_gap = src.boundary_value(p_vertices,
-                                                s_faces,
-                                                s2_w_gap_vertex_idxs,
-                                                internal_vertex_idxs,
-                                                s_thickness_profile_w_gap,
-                                                param.blending_order)
-
-    # without gap
-    harmonic_weights_wo_gap = src.boundary_value(p_vertices,
-                                                 s_faces,
-                                                 s2_wo_gap_vertex_idxs,
-                                                 internal_vertex_idxs,
-                                                 s_thickness_profile_wo_gap,
-                                                 param.blending_order)
+    # both variants share the boundary, so the system is factorized once and solved for the with and without gap values
+    boundaries = np.concatenate((internal_vertex_idxs, s2_w_gap_vertex_idxs))
+    blending = src.HarmonicBlending(p_vertices, s_faces, boundaries, param.blending_order, s_face_idxs)
+    harmonic_weights_w_gap, harmonic_weights_wo_gap = blending.solve(s_thickness_profiles[:, boundaries])
 
     # we make sure the thickness is not exceeding the thickness factor limit by putting a limit to extrusion
     # with gap
-    s_maximum_thickness_allowed_w_gap, _ = src.assign_thickness(p_vertices,
-                                                                s_faces,
-                                                                sb_vertices,
-                                                                sb_faces,
-                                                                s_face_idxs,
-                                                                param.w_gap_thickness_factor)
-    # without gap
-    s_maximum_thickness_allowed_wo_gap, _ = src.assign_thickness(p_vertices,
-                                                                 s_faces,
-                                                                 sb_vertices,
-                                                                 sb_faces,
-                                                                 s_face_idxs,
-                                                                 param.wo_gap_thickness_factor)
-
-    for i in s_vertex_idxs:
-        if harmonic_weights_w_gap[i] > np.max(s_maximum_thickness_allowed_w_gap):
-            harmonic_weights_w_gap[i] = np.max(s_maximum_thickness_allowed_w_gap)
+    harmonic_weights_w_gap[s_vertex_idxs] = np.minimum(harmonic_weights_w_gap[s_vertex_idxs],
+                                                       s_maximum_thickness_allowed[0])
 
     harmonic_weights_w_gap = harmonic_weights_w_gap[s_vertex_idxs]
     harmonic_weights_wo_gap = harmonic_weights_wo_gap[s_vertex_idxs]
 
     # extrude surface
-    s_vertices_w_gap = src.extrude_cartilage(p_vertices,
-                                             p_faces,
-                                             s_face_idxs,
-                                             harmonic_weights_w_gap)
-
-    s_vertices_wo_gap = src.extrude_cartilage(p_vertices,
-                                              p_faces,
-                                              s_face_idxs,
-                                              harmonic_weights_wo_gap)
+    s_vertices_w_gap, s_vertices_wo_gap = src.extrude_cartilage_variants(p_vertices,
+                                                                         p_faces,
+                                                                         s_face_idxs,
+                                                                         [harmonic_weights_w_gap,
+                                                                          harmonic_weights_wo_gap])
 
     frame = mp.plot(p_vertices, p_faces, c=src.bone, shading=src.sh_true)
     frame.add_mesh(s_vertices_w_gap, s_faces[s1_face_idxs], c=src.pastel_green, shading=src.sh_true)
@@ -300,20 +252,18 @@ def get_hj_ac(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_pa
     print("minimum cartilage thickness w/wo gap is: ", np.round(np.min(harmonic_thick_w_gap), 2),"/", np.round(np.min(harmonic_thick_wo_gap), 2) )
 
     # This data will be used later to create the hip joint femoral cartilage
-    sb_face_adjacency, sb_cumulative_sum = igl.vertex_triangle_adjacency(sb_faces, len(sb_vertices))
+    sb_topology = src.MeshTopology(sb_vertices, sb_faces)
+    sb_face_adjacency, sb_cumulative_sum = sb_topology.vertex_faces
 
     _, fc_vertex_idxs = src.get_initial_surface2(p_vertices,
                                                  s_faces[ear_s1_face_idxs],
                                                  sb_vertices,
                                                  sb_faces,
                                                  param.gap_distance)
-    fc_face_idxs = []
-    for j in fc_vertex_idxs:
-        for k in range(sb_cumulative_sum[j], sb_cumulative_sum[j + 1]):
-            fc_face_idxs += [sb_face_adjacency[k]]
-    fc_face_idxs = np.array(fc_face_idxs)
+    fc_face_idxs = sb_topology.vertex_star(fc_vertex_idxs)
 
-    fc_face_idxs = src.gap_fill(sb_vertices, sb_faces, fc_face_idxs, sb_face_adjacency, sb_cumulative_sum)
+    fc_face_idxs = src.gap_fill(sb_vertices, sb_faces, fc_face_idxs, sb_face_adjacency, sb_cumulative_sum,
+                                morphology=sb_topology.morphology)
 
     frame = mp.plot(sb_vertices, sb_faces, c=src.bone, shading=src.sh_false)
     frame.add_mesh(p_vertices, p_faces[s_face_idxs], c=src.pastel_blue, shading=src.sh_true)
@@ -357,10 +307,10 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
     # primary interface vertices
     p_vertices = np.copy(pb_vertices)
     p_faces = np.copy(pb_faces)
-    p_vertex_idxs = np.unique(p_faces.flatten())
 
     # bone adjacency faces
-    face_adjacency, cumulative_sum = igl.vertex_triangle_adjacency(p_faces, len(p_vertices))
+    p_topology = src.MeshTopology(p_vertices, p_faces)
+    face_adjacency, cumulative_sum = p_topology.vertex_faces
 
     # trim the initial primary interface if needed
     if param.trimming_iteration != 0:
@@ -368,7 +318,8 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
                                              int_p_face_idxs,
                                              face_adjacency,
                                              cumulative_sum,
-                                             param.trimming_iteration)
+                                             param.trimming_iteration,
+                                             morphology=p_topology.morphology)
     else:
         trim_p_face_idxs = np.copy(int_p_face_idxs)
 
@@ -377,9 +328,7 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
 
     # remove ears
     ear_p_face_idxs = np.copy(one_p_face_idxs)
-
-    for i in range(15):
-        ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs)
+    ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs, 15)
 
     # viz
     frame = mp.plot(p_vertices, p_faces, c=src.bone, shading=src.sh_false)
@@ -402,23 +351,24 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
                                           cumulative_sum,
                                           curvature_value,
                                           param.min_curvature_threshold,
-                                          param.max_curvature_threshold)
+                                          param.max_curvature_threshold,
+                                          morphology=p_topology.morphology)
     # trim the base
     if param.trimming_base_iteration != 0:
         trim_grow_p_face_idxs = src.trim_boundary(p_faces,
                                              grow_p_face_idxs,
                                              face_adjacency,
                                              cumulative_sum,
-                                             param.trimming_base_iteration)
+                                             param.trimming_base_iteration,
+                                             morphology=p_topology.morphology)
 
     # remove ears
     ear_grow_p_face_idxs = np.copy(trim_grow_p_face_idxs)
-    for i in range(5):
-        ear_grow_p_face_idxs = src.remove_ears(p_faces, ear_grow_p_face_idxs)
+    ear_grow_p_face_idxs = src.remove_ears(p_faces, ear_grow_p_face_idxs, 5)
 
     # the base of the Femoral cartilage, referred to as $\F_{C}^{D}$ in the manuscript
     p_face_idxs = np.copy(ear_grow_p_face_idxs)
-    boundary_edges = igl.boundary_facets(p_faces[p_face_idxs])
+    boundary_edges = p_topology.boundary_edges(p_face_idxs)
 
     # separate and smooth
     if param.smoothing_iteration_base != 0:
@@ -444,61 +394,41 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
     s_face_idxs = np.copy(p_face_idxs)
     s_vertex_idxs = np.unique(s_faces[s_face_idxs].flatten())
 
-    s_edge_vertex_idxs = igl.boundary_facets(s_faces[s_face_idxs])
-    s_edge_vertex_idxs = np.unique(s_edge_vertex_idxs.flatten())
+    # s_faces is a copy of p_faces, so the subset boundary is the one of the primary topology
+    s_edge_vertex_idxs = p_topology.boundary_vertices(s_face_idxs)
 
-    # geodesic distance from all the points on the primary bone to the boundary of the secondary interface
-    dist_to_s_boundary= igl.exact_geodesic(p_vertices, s_faces, s_edge_vertex_idxs, p_vertex_idxs)
+    # geodesic distance from the points of the secondary interface to its boundary, only as far as the taper reaches
+    # (inf beyond the bandwidth), exact for a small band and the heat method for a large one
+    s_geodesic = src.PatchGeodesic(p_vertices, s_faces, s_face_idxs, s_edge_vertex_idxs, param.bandwidth)
+    dist_to_s_boundary = s_geodesic.distance()
 
     # select the first subset of the secondary interface $\F_{C}^{D}$ to extrude
     s1_face_idxs = np.copy(ear_p_face_idxs)
 
-    # assign a thickness profile to the first subset (s1)
-    # with gap
-    s_thickness_profile_w_gap, s_minimum_height_w_gap = src.assign_thickness(p_vertices,
-                                                                             p_faces,
-                                                                             sb_vertices,
-                                                                             sb_faces,
-                                                                             s1_face_idxs,
-                                                                             param.w_gap_thickness_factor)
-
-    # without gap
-    s_thickness_profile_wo_gap, s_minimum_height_wo_gap = src.assign_thickness(p_vertices,
-                                                                               p_faces,
-                                                                               sb_vertices,
-                                                                               sb_faces,
-                                                                               s1_face_idxs,
-                                                                               param.wo_gap_thickness_factor)
+    # assign a thickness profile to the first subset (s1), with and without gap at once
+    thickness_factors = [param.w_gap_thickness_factor, param.wo_gap_thickness_factor]
+    s_thickness_profiles, s_minimum_heights = src.assign_thickness_variants(p_vertices,
+                                                                            p_faces,
+                                                                            sb_vertices,
+                                                                            sb_faces,
+                                                                            s1_face_idxs,
+                                                                            thickness_factors)
+    s_minimum_height_w_gap, s_minimum_height_wo_gap = s_minimum_heights
 
     print('minimum thickness in the initial layer with gap', np.round(s_minimum_height_w_gap, 5))
     print('minimum thickness in the initial layer without gap', np.round(s_minimum_height_wo_gap, 5))
 
     # select the second subset of the secondary interface (s2) and extrude
-    # w_gap
-    s2_w_gap_vertex_idxs = []
-    for count, value in enumerate(dist_to_s_boundary):
-        if value <= param.bandwidth:
-            s_thickness_profile_w_gap[count] = s_minimum_height_w_gap * np.sin(value * np.pi / (2 * param.bandwidth))
-            s2_w_gap_vertex_idxs.append(count)
+    s_thickness_profiles, s2_vertex_idxs = src.taper_thickness(s_thickness_profiles,
+                                                               s_minimum_heights,
+                                                               dist_to_s_boundary,
+                                                               param.bandwidth)
 
-    s2_w_gap_vertex_idxs = np.intersect1d(s_vertex_idxs, np.array(s2_w_gap_vertex_idxs))
+    # the band does not depend on the thickness factor, both variants share it
+    s2_w_gap_vertex_idxs = np.intersect1d(s_vertex_idxs, s2_vertex_idxs)
 
-    # find the corresponding faces of these vertices (for visualization)
-    s2_w_gap_face_idxs = []
-    for j in s2_w_gap_vertex_idxs:
-        for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
-            s2_w_gap_face_idxs += [face_adjacency[k]]
-
-    s2_w_gap_face_idxs = np.intersect1d(s_face_idxs, np.array(s2_w_gap_face_idxs))
-
-    # wo_gap
-    s2_wo_gap_vertex_idxs = []
-    for count, value in enumerate(dist_to_s_boundary):
-        if value <= param.bandwidth:
-            s_thickness_profile_wo_gap[count] = s_minimum_height_wo_gap * np.sin(value * np.pi / (2 * param.bandwidth))
-            s2_wo_gap_vertex_idxs.append(count)
-
-    s2_wo_gap_vertex_idxs = np.intersect1d(s_vertex_idxs, np.array(s2_wo_gap_vertex_idxs))
+    # find the corresponding faces of these vertices (for visualization, s_faces is a copy of p_faces)
+    s2_w_gap_face_idxs = np.intersect1d(s_face_idxs, p_topology.vertex_star(s2_w_gap_vertex_idxs))
 
     " Step C. closed the cartilage using Harmonic boundary blending "
 
@@ -510,55 +440,33 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
     internal_vertex_idxs = np.unique(s_faces[s1_face_idxs].flatten())
 
     # we compute a blended extrusion on the remaining of $\faces_{C}^{E}$ which we did not initially select for extrusion
-    # with gap
-    harmonic_weights_w_gap = src.boundary_value(p_vertices,
-                                                s_faces,
-                                                s2_w_gap_vertex_idxs,
-                                                internal_vertex_idxs,
-                                                s_thickness_profile_w_gap,
-                                                param.blending_order)
-
-    # without gap
-    harmonic_weights_wo_gap = src.boundary_value(p_vertices,
-                                                 s_faces,
-                                                 s2_wo_gap_vertex_idxs,
-                                                 internal_vertex_idxs,
-                                                 s_thickness_profile_wo_gap,
-                                                 param.blending_order)
+    # both variants share the boundary, so the system is factorized once and solved for the with and without gap values
+    boundaries = np.concatenate((internal_vertex_idxs, s2_w_gap_vertex_idxs))
+    blending = src.HarmonicBlending(p_vertices, s_faces, boundaries, param.blending_order, s_face_idxs)
+    harmonic_weights_w_gap, harmonic_weights_wo_gap = blending.solve(s_thickness_profiles[:, boundaries])
 
     # we make sure the thickness is not exceeding the thickness factor limit by putting a limit to extrusion
+    s_maximum_thickness_allowed, _ = src.assign_thickness_variants(p_vertices,
+                                                                   s_faces,
+                                                                   sb_vertices,
+                                                                   sb_faces,
+                                                                   s_face_idxs,
+                                                                   thickness_factors)
+    s_maximum_thickness_allowed = np.max(s_maximum_thickness_allowed, axis=1)
+
     # with gap
-    s_maximum_thickness_allowed_w_gap, _ = src.assign_thickness(p_vertices,
-                                                                s_faces,
-                                                                sb_vertices,
-                                                                sb_faces,
-                                                                s_face_idxs,
-                                                                param.w_gap_thickness_factor)
-    # without gap
-    s_maximum_thickness_allowed_wo_gap, _ = src.assign_thickness(p_vertices,
-                                                                 s_faces,
-                                                                 sb_vertices,
-                                                                 sb_faces,
-                                                                 s_face_idxs,
-                                                                 param.wo_gap_thickness_factor)
-
-    for i in s_vertex_idxs:
-        if harmonic_weights_w_gap[i] > np.max(s_maximum_thickness_allowed_w_gap):
-            harmonic_weights_w_gap[i] = np.max(s_maximum_thickness_allowed_w_gap)
+    harmonic_weights_w_gap[s_vertex_idxs] = np.minimum(harmonic_weights_w_gap[s_vertex_idxs],
+                                                       s_maximum_thickness_allowed[0])
 
     harmonic_weights_w_gap = harmonic_weights_w_gap[s_vertex_idxs]
     harmonic_weights_wo_gap = harmonic_weights_wo_gap[s_vertex_idxs]
 
     # extrude surface
-    s_vertices_w_gap = src.extrude_cartilage(p_vertices,
-                                             p_faces,
-                                             s_face_idxs,
-                                             harmonic_weights_w_gap)
-
-    s_vertices_wo_gap = src.extrude_cartilage(p_vertices,
-                                              p_faces,
-                                              s_face_idxs,
-                                              harmonic_weights_wo_gap)
+    s_vertices_w_gap, s_vertices_wo_gap = src.extrude_cartilage_variants(p_vertices,
+                                                                         p_faces,
+                                                                         s_face_idxs,
+                                                                         [harmonic_weights_w_gap,
+                                                                          harmonic_weights_wo_gap])
 
     frame = mp.plot(p_vertices, p_faces, c=src.bone, shading=src.sh_true)
     frame.add_mesh(s_vertices_w_gap, s_faces[s1_face_idxs], c=src.pastel_green, shading=src.sh_true)
@@ -629,12 +537,12 @@ def get_hj_fc(pb_vertices, pb_faces, sb_vertices, sb_faces, int_p_face_idxs, par
     subject_id = df.loc[1, 'Value']
 
     if df.loc[7, 'Value'] == 'empty':
-        np.save(str(mid_outputs_dir) + '/' + str(subject_id) + '_lhj_fc_base_faces', pb_vertices[basep_vertex_idxs])
+        src.save_array(str(mid_outputs_dir) + '/' + str(subject_id) + '_lhj_fc_base_faces', pb_vertices[basep_vertex_idxs])
         df.loc[7, 'Value'] = np.round(cartilage_area, 2)
         df.loc[8, 'Value'] = np.round(np.mean(harmonic_thick_w_gap), 2)
         df.loc[9, 'Value'] = np.round(np.mean(harmonic_thick_wo_gap), 2)
     else:
-        np.save(str(mid_outputs_dir) + '/' + str(subject_id) + '_rhj_fc_base_faces', pb_vertices[basep_vertex_idxs])
+        src.save_array(str(mid_outputs_dir) + '/' + str(subject_id) + '_rhj_fc_base_faces', pb_vertices[basep_vertex_idxs])
         df.loc[14, 'Value'] = np.round(cartilage_area, 2)
         df.loc[15, 'Value'] = np.round(np.mean(harmonic_thick_w_gap), 2)
         df.loc[16, 'Value'] = np.round(np.mean(harmonic_thick_wo_gap), 2)
@@ -692,8 +600,10 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
     s_faces = np.copy(sb_faces)
 
     # bone adjacency faces
-    face_adjacency_p, cumulative_sum_p = igl.vertex_triangle_adjacency(p_faces, len(p_vertices))
-    face_adjacency_s, cumulative_sum_s = igl.vertex_triangle_adjacency(s_faces, len(s_vertices))
+    p_topology = src.MeshTopology(p_vertices, p_faces)
+    s_topology = src.MeshTopology(s_vertices, s_faces)
+    face_adjacency_p, cumulative_sum_p = p_topology.vertex_faces
+    face_adjacency_s, cumulative_sum_s = s_topology.vertex_faces
 
     # initial cartilage surface definition
     int_p_face_idxs, _ = src.get_initial_surface(p_vertices, p_faces, sb_vertices, sb_faces, param.gap_distance)
@@ -704,7 +614,8 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
                                              int_p_face_idxs,
                                              face_adjacency_p,
                                              cumulative_sum_p,
-                                             param.trimming_iteration_p)
+                                             param.trimming_iteration_p,
+                                             morphology=p_topology.morphology)
     else:
         trim_p_face_idxs = np.copy(int_p_face_idxs)
 
@@ -713,8 +624,7 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
 
     # remove ears
     ear_p_face_idxs = np.copy(ear_p_face_idxs)
-    for i in range(10):
-        ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs)
+    ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs, 10)
 
     # the primary interface of the sacroiliac joint, referred to as $\F_{C}^{D}$ in the manuscript
     p_face_idxs = np.copy(ear_p_face_idxs)
@@ -751,12 +661,9 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
                                                        p_face_idxs,
                                                        neigh_p_face_list)
 
-        folded_p_vertex_idxs = []
         # np.float64(2) # max_angle
-        for count, i in enumerate(smoothed_max_angles_p):
-            if i > np.float64(2):
-                folded_p_vertex_idxs.append(count)
-                iteration.append(ss - 1)
+        folded_p_vertex_idxs = np.flatnonzero(smoothed_max_angles_p > np.float64(2)).tolist()
+        iteration += [ss - 1] * len(folded_p_vertex_idxs)
 
     smoothed_max_angle_p = np.max(smoothed_max_angles_p)
     smoothed_max_angle_p = np.round(smoothed_max_angle_p, 2)
@@ -780,7 +687,7 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
 
         # vz
         print("faulty vertices & neighbouring triangles:")
-        frame = mp.plot(p_vertices, faces_p[p_face_idxs], c=src.pastel_blue, shading=src.sh_false)
+        frame = mp.plot(p_vertices, p_faces[p_face_idxs], c=src.pastel_blue, shading=src.sh_false)
         frame.add_points(p_vertices[boundary_p_vertex_idxs[folded_p_vertex_idxs]],
                          shading={"point_size": 0.2, "point_color": "red"})
 
@@ -794,7 +701,7 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
         if param.fix_boundary:
             p_face_idxs = src.fix_boundary(p_vertices, p_faces, p_face_idxs, boundary_p_vertex_idxs,
                                            folded_p_vertex_idxs)
-            boundary_p_vertex_idxs = igl.boundary_loop(faces_p[p_face_idxs])
+            boundary_p_vertex_idxs = p_topology.boundary_loop(p_face_idxs)
 
             # print("normal visualization of the fixed result:")
             # centroids_p, end_points_p = src.norm_visualization(p_vertices, p_faces[p_face_idxs])
@@ -816,35 +723,32 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
                                                     s_faces,
                                                     param.gap_distance)
 
-    int_s_face_idxs = []
-    for j in int_s_vertex_idxs:
-        for k in range(cumulative_sum_s[j], cumulative_sum_s[j + 1]):
-            int_s_face_idxs += [face_adjacency_s[k]]
-
-    int_s_face_idxs = np.array(int_s_face_idxs)
+    int_s_face_idxs = s_topology.vertex_star(int_s_vertex_idxs)
 
     rm_out_int_face_idxs_s = src.trim_boundary(s_faces,
                                                int_s_face_idxs,
                                                face_adjacency_s,
                                                cumulative_sum_s,
-                                               1)
+                                               1,
+                                               morphology=s_topology.morphology)
 
     if param.trimming_iteration_s != 0:
         trim_s_face_idxs = src.trim_boundary(s_faces,
                                              rm_out_int_face_idxs_s,
                                              face_adjacency_s,
                                              cumulative_sum_s,
-                                             param.trimming_iteration_s)
+                                             param.trimming_iteration_s,
+                                             morphology=s_topology.morphology)
     else:
         trim_s_face_idxs = np.copy(rm_out_int_face_idxs_s)
 
     one_s_face_idxs = src.get_largest_component(s_faces, trim_s_face_idxs)
 
-    for i in range(10):
-        one_s_face_idxs = src.remove_ears(s_faces, one_s_face_idxs)
+    one_s_face_idxs = src.remove_ears(s_faces, one_s_face_idxs, 10)
 
 
-    s_face_idxs = src.gap_fill(s_vertices, s_faces, one_s_face_idxs, face_adjacency_s, cumulative_sum_s)
+    s_face_idxs = src.gap_fill(s_vertices, s_faces, one_s_face_idxs, face_adjacency_s, cumulative_sum_s,
+                               morphology=s_topology.morphology)
 
     frame = mp.plot(s_vertices, s_faces, c=src.bone, shading=src.sh_false)
     frame.add_mesh(s_vertices, s_faces[s_face_idxs], c=src.pastel_green, shading=src.sh_true)
@@ -877,12 +781,9 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
         s_vertices = src.snap_to_surface(s_vertices, sb_vertices, s_faces)
         smoothed_max_angles_s = src.get_dihedral_angle(s_vertices, s_faces, s_face_idxs, neigh_s_face_list)
 
-        folded_s_vertex_idxs = []
         # np.float64(2) # max_angle
-        for count, i in enumerate(smoothed_max_angles_s):
-            if i > np.float64(2):
-                folded_s_vertex_idxs.append(count)
-                iteration.append(ss - 1)
+        folded_s_vertex_idxs = np.flatnonzero(smoothed_max_angles_s > np.float64(2)).tolist()
+        iteration += [ss - 1] * len(folded_s_vertex_idxs)
 
     smoothed_max_angle_secondary= np.max(smoothed_max_angles_s)
     smoothed_max_angle_secondary = np.round(smoothed_max_angle_secondary, 2)
@@ -910,7 +811,7 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
                          shading={"point_size": 0.2, "point_color": "red"})
 
         faces = s_faces[s_face_idxs]
-        for i in folded_vertex_idxs:
+        for i in folded_s_vertex_idxs:
             frame.add_mesh(s_vertices, faces[np.array(neigh_s_face_list[i])], c=src.sweet_pink,
                            shading=src.sh_true)
             frame.add_mesh(s_vertices, faces[np.array(boundary_s_face_idxs[i])], c=src.pastel_yellow,
@@ -919,7 +820,7 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
         if param.fix_boundary:
             s_face_idxs = src.fix_boundary(s_vertices, s_faces, s_face_idxs, boundary_s_vertex_idxs,
                                            folded_s_vertex_idxs)
-            boundary_s_vertex_idxs = igl.boundary_loop(s_faces[s_face_idxs])
+            boundary_s_vertex_idxs = s_topology.boundary_loop(s_face_idxs)
             print("normal visualization of the fixed result:")
             # centroids_s, end_points_s = src.norm_visualization(s_vertices, s_faces[s_face_idxs])
             # frame = mp.plot(s_vertices, s_faces[s_face_idxs], c=src.pastel_blue, shading=src.sh_true)
@@ -981,13 +882,20 @@ def get_sj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_path)
     df = pd.read_csv(str(anatomical_path), encoding='utf-8')
 
     # cartilage area
-    cartilage_area_p = src.get_area(p_vertices, p_faces[p_face_idxs])
-    cartilage_area_s = src.get_area(s_vertices, s_faces[s_face_idxs])
+    cartilage_area_p, = src.region_areas(p_vertices, p_faces, [p_face_idxs])
+    cartilage_area_s, = src.region_areas(s_vertices, s_faces, [s_face_idxs])
 
-    # average thickness
+    # average thickness, the distance from the primary to the secondary interface at the primary triangle centroids
     triangle_centroids = igl.barycenter(p_vertices, p_faces[p_face_idxs])
     sdd, _, _ = igl.signed_distance(triangle_centroids, s_vertices, s_faces[s_face_idxs], return_normals=False)
 
+    # area weighted statistics of the same distances
+    thickness = src.thickness_stats(p_vertices, p_faces[p_face_idxs], sdd, per_face=True)
+    print("cartilage area primary/secondary is: ", np.round(cartilage_area_p, 2), "/", np.round(cartilage_area_s, 2))
+    print("cartilage thickness min/mean/max is: ", np.round(thickness['min'], 2), "/", np.round(thickness['mean'], 2),
+          "/", np.round(thickness['max'], 2), ", 5/50/95 percentiles: ", np.round(thickness['p5'], 2), "/",
+          np.round(thickness['p50'], 2), "/", np.round(thickness['p95'], 2))
+
     if df.loc[18, 'Value'] == 'empty':
         df.loc[18, 'Value'] = np.round(cartilage_area_p, 2)
         df.loc[19, 'Value'] = np.round(cartilage_area_s, 2)
@@ -1025,8 +933,10 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
     s_faces = np.copy(sb_faces)
 
     # bone adjacency faces
-    face_adjacency_p, cumulative_sum_p = igl.vertex_triangle_adjacency(p_faces, len(p_vertices))
-    face_adjacency_s, cumulative_sum_s = igl.vertex_triangle_adjacency(s_faces, len(s_vertices))
+    p_topology = src.MeshTopology(p_vertices, p_faces)
+    s_topology = src.MeshTopology(s_vertices, s_faces)
+    face_adjacency_p, cumulative_sum_p = p_topology.vertex_faces
+    face_adjacency_s, cumulative_sum_s = s_topology.vertex_faces
 
     " Step A. Primary interface estimation "
 
@@ -1039,7 +949,8 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
                                              int_p_face_idxs,
                                              face_adjacency_p,
                                              cumulative_sum_p,
-                                             param.trimming_iteration_p)
+                                             param.trimming_iteration_p,
+                                             morphology=p_topology.morphology)
     else:
         trim_p_face_idxs = np.copy(int_p_face_idxs)
 
@@ -1048,8 +959,7 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
 
     # remove ears
     ear_p_face_idxs = np.copy(ear_p_face_idxs)
-    for i in range(10):
-        ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs)
+    ear_p_face_idxs = src.remove_ears(p_faces, ear_p_face_idxs, 10)
 
     # the primary interface of the pubic joint, referred to as $\F_{C}^{D}$ in the manuscript
     p_face_idxs = np.copy(ear_p_face_idxs)
@@ -1086,12 +996,9 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
                                                        p_face_idxs,
                                                        neigh_p_face_list)
 
-        folded_p_vertex_idxs = []
         # np.float64(2) # max_angle
-        for count, i in enumerate(smoothed_max_angles_p):
-            if i > np.float64(2):
-                folded_p_vertex_idxs.append(count)
-                iteration.append(ss - 1)
+        folded_p_vertex_idxs = np.flatnonzero(smoothed_max_angles_p > np.float64(2)).tolist()
+        iteration += [ss - 1] * len(folded_p_vertex_idxs)
 
     smoothed_max_angle_p = np.max(smoothed_max_angles_p)
     smoothed_max_angle_p = np.round(smoothed_max_angle_p, 2)
@@ -1115,7 +1022,7 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
 
         # vz
         print("faulty vertices & neighbouring triangles:")
-        frame = mp.plot(p_vertices, faces_p[p_face_idxs], c=src.pastel_blue, shading=src.sh_false)
+        frame = mp.plot(p_vertices, p_faces[p_face_idxs], c=src.pastel_blue, shading=src.sh_false)
         frame.add_points(p_vertices[boundary_p_vertex_idxs[folded_p_vertex_idxs]],
                          shading={"point_size": 0.2, "point_color": "red"})
 
@@ -1129,7 +1036,7 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
         if param.fix_boundary:
             p_face_idxs = src.fix_boundary(p_vertices, p_faces, p_face_idxs, boundary_p_vertex_idxs,
                                            folded_p_vertex_idxs)
-            boundary_p_vertex_idxs = igl.boundary_loop(faces_p[p_face_idxs])
+            boundary_p_vertex_idxs = p_topology.boundary_loop(p_face_idxs)
 
             # print("normal visualization of the fixed result:")
             # centroids_p, end_points_p = src.norm_visualization(p_vertices, p_faces[p_face_idxs])
@@ -1154,7 +1061,8 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
                                              int_s_face_idxs,
                                              face_adjacency_s,
                                              cumulative_sum_s,
-                                             param.trimming_iteration_s)
+                                             param.trimming_iteration_s,
+                                             morphology=s_topology.morphology)
     else:
         trim_s_face_idxs = np.copy(int_s_face_idxs)
 
@@ -1162,8 +1070,7 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
     one_s_face_idxs = src.get_largest_component(s_faces, trim_s_face_idxs)
 
     # remove ears
-    for i in range(10):
-        one_s_face_idxs = src.remove_ears(s_faces, one_s_face_idxs)
+    one_s_face_idxs = src.remove_ears(s_faces, one_s_face_idxs, 10)
 
 
     s_face_idxs = np.copy (one_s_face_idxs)
@@ -1198,12 +1105,9 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
         s_vertices = src.snap_to_surface(s_vertices, sb_vertices, s_faces)
         smoothed_max_angles_s = src.get_dihedral_angle(s_vertices, s_faces, s_face_idxs, neigh_s_face_list)
 
-        folded_s_vertex_idxs = []
         # np.float64(2) # max_angle
-        for count, i in enumerate(smoothed_max_angles_s):
-            if i > np.float64(2):
-                folded_s_vertex_idxs.append(count)
-                iteration.append(ss - 1)
+        folded_s_vertex_idxs = np.flatnonzero(smoothed_max_angles_s > np.float64(2)).tolist()
+        iteration += [ss - 1] * len(folded_s_vertex_idxs)
 
     smoothed_max_angle_secondary= np.max(smoothed_max_angles_s)
     smoothed_max_angle_secondary = np.round(smoothed_max_angle_secondary, 2)
@@ -1231,7 +1135,7 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
                          shading={"point_size": 0.2, "point_color": "red"})
 
         faces = s_faces[s_face_idxs]
-        for i in folded_vertex_idxs:
+        for i in folded_s_vertex_idxs:
             frame.add_mesh(s_vertices, faces[np.array(neigh_s_face_list[i])], c=src.sweet_pink,
                            shading=src.sh_true)
             frame.add_mesh(s_vertices, faces[np.array(boundary_s_face_idxs[i])], c=src.pastel_yellow,
@@ -1240,7 +1144,7 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
         if param.fix_boundary:
             s_face_idxs = src.fix_boundary(s_vertices, s_faces, s_face_idxs, boundary_s_vertex_idxs,
                                            folded_s_vertex_idxs)
-            boundary_s_vertex_idxs = igl.boundary_loop(s_faces[s_face_idxs])
+            boundary_s_vertex_idxs = s_topology.boundary_loop(s_face_idxs)
             print("normal visualization of the fixed result:")
             # centroids_s, end_points_s = src.norm_visualization(s_vertices, s_faces[s_face_idxs])
             # frame = mp.plot(s_vertices, s_faces[s_face_idxs], c=src.pastel_blue, shading=src.sh_true)
@@ -1301,13 +1205,20 @@ def get_gap_pj(pb_vertices, pb_faces, sb_vertices, sb_faces, param, anatomical_p
     df = pd.read_csv(str(anatomical_path), encoding='utf-8')
 
     # cartilage area
-    cartilage_area_p = src.get_area(p_vertices, p_faces[p_face_idxs])
-    cartilage_area_s = src.get_area(s_vertices, s_faces[s_face_idxs])
+    cartilage_area_p, = src.region_areas(p_vertices, p_faces, [p_face_idxs])
+    cartilage_area_s, = src.region_areas(s_vertices, s_faces, [s_face_idxs])
 
-    # average thickness
+    # average thickness, the distance from the primary to the secondary interface at the primary triangle centroids
     triangle_centroids = igl.barycenter(p_vertices, p_faces[p_face_idxs])
     sdd, _, _ = igl.signed_distance(triangle_centroids, s_vertices, s_faces[s_face_idxs], return_normals=False)
 
+    # area weighted statistics of the same distances
+    thickness = src.thickness_stats(p_vertices, p_faces[p_face_idxs], sdd, per_face=True)
+    print("cartilage area primary/secondary is: ", np.round(cartilage_area_p, 2), "/", np.round(cartilage_area_s, 2))
+    print("cartilage thickness min/mean/max is: ", np.round(thickness['min'], 2), "/", np.round(thickness['mean'], 2),
+          "/", np.round(thickness['max'], 2), ", 5/50/95 percentiles: ", np.round(thickness['p5'], 2), "/",
+          np.round(thickness['p50'], 2), "/", np.round(thickness['p95'], 2))
+
     df.loc[24, 'Value'] = np.round(cartilage_area_p, 2)
     df.loc[25, 'Value'] = np.round(cartilage_area_s, 2)
     df.loc[26, 'Value'] = np.round(np.mean(sdd), 2)
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+
+lfs_pointer_header = b'version https://git-lfs.github.com/spec/v1'
+
+# pointer files are a few lines of text, anything bigger is real data
+lfs_pointer_max_size = 1024
+
+subject_pattern = re.compile(r'^(m\d+)(?:[_-]|$)')
+
+# folders whose artifacts are grouped one level deeper, e.g. MidOutputs/nodal_output/m1
+nested_kinds = ('MidOutputs', 'mid_outputs')
+
+
+def _subject_key(subject_id):
+
+    return int(subject_id[1:])
+
+
+class Artifact:
+    """
+    A file of the model repository or of the generation output. Nothing is read until it is asked for: the size comes
+    from the file system, the hash is computed on first use and git-LFS pointer stubs are recognized from their first
+    line only.
+    """
+
+    def __init__(self, path, subject_id, kind):
+        self.path = Path(path)
+        self.subject_id = subject_id
+        self.kind = kind
+        name = self.path.name[:-len(self.path.suffix)] if self.path.suffix else self.path.name
+        match = subject_pattern.match(name)
+        if match and match.group(1) == subject_id:
+            name = name[len(subject_id) + 1:]
+        self.name = name
+        self._lfs = None
+        self._sha256 = None
+
+    def __repr__(self):
+        return "Artifact(%s, %s, %s)" % (self.subject_id, self.kind, self.path.name)
+
+    @property
+    def file_size(self):
+        return self.path.stat().st_size
+
+    def _read_lfs_pointer(self):
+        if self._lfs is None:
+            self._lfs = {}
+            if self.file_size <= lfs_pointer_max_size:
+                with open(self.path, 'rb') as fl:
+                    head = fl.read(lfs_pointer_max_size)
+                if head.startswith(lfs_pointer_header):
+                    for line in head.decode('ascii', 'replace').splitlines()[1:]:
+                        key, _, value = line.partition(' ')
+                        self._lfs[key] = value
+        return self._lfs
+
+    @property
+    def is_lfs_pointer(self):
+        return len(self._read_lfs_pointer()) > 0
+
+    @property
+    def size(self):
+        """
+        size of the artifact in bytes, for a git-LFS stub the size of the real file
+        """
+        lfs = self._read_lfs_pointer()
+        if lfs:
+            return int(lfs['size'])
+        return self.file_size
+
+    @property
+    def sha256(self):
+        """
+        sha256 of the artifact, for a git-LFS stub the oid of the real file
+        """
+        if self._sha256 is None:
+            lfs = self._read_lfs_pointer()
+            if lfs:
+                self._sha256 = lfs['oid'].split(':', 1)[-1]
+            else:
+                sha = hashlib.sha256()
+                with open(self.path, 'rb') as fl:
+                    for block in iter(lambda: fl.read(1 << 20), b''):
+                        sha.update(block)
+                self._sha256 = sha.hexdigest()
+        return self._sha256
+
+    def load(self, *args, **kwargs):
+        """
+        read the artifact with the reader of its file type, extra arguments are passed to that reader
+
+        surface meshes: src.read (input_dimension), volume meshes: src.read_volume_mesh (input_dimension,
+        output_dimension), arrays: src.load_array, tables: pandas.read_csv, json: json.load, anything else: bytes
+        """
+        if self.is_lfs_pointer:
+            raise ValueError("git-LFS pointer, run 'git lfs pull' first: " + str(self.path))
+
+        import src
+
+        suffix = self.path.suffix.lower()
+        path = str(self.path)
+
+        if suffix in ('.obj', '.stl', '.off', '.ply'):
+            return src.read(path, *args, **kwargs)
+        if suffix in ('.msh', '.npz'):
+            return src.read_volume_mesh(path, *args, **kwargs)
+        if suffix == '.npy':
+            return src.load_array(path, *args, **kwargs)
+        if suffix == '.csv':
+            import pandas as pd
+            return pd.read_csv(path, *args, **kwargs)
+        if suffix == '.json':
+            with open(path, 'r') as fl:
+                return json.load(fl)
+
+        return self.path.read_bytes()
+
+
+class Catalog:
+    """
+    An index of the artifacts under model_repository and model_generation. Each kind of artifact (the first folder,
+    e.g. CleanSegment or volgen_output, or MidOutputs/nodal_output) is listed once, on first use.
+    """
+
+    def __init__(self, main_dir, roots=('model_repository', 'model_generation')):
+        self.main_dir = Path(main_dir)
+        self.roots = [self.main_dir / root for root in roots if (self.main_dir / root).is_dir()]
+        self._index = {}
+
+    def kinds(self):
+        kinds = []
+        for root in self.roots:
+            for entry in sorted(os.scandir(root), key=lambda e: e.name):
+                if not entry.is_dir():
+                    continue
+                if entry.name in nested_kinds:
+                    kinds += [entry.name + '/' + sub.name for sub in sorted(os.scandir(entry.path), key=lambda e: e.name)
+                              if sub.is_dir()]
+                else:
+                    kinds.append(entry.name)
+        return kinds
+
+    def _kind_dir(self, kind):
+        for root in self.roots:
+            if (root / kind).is_dir():
+                return root / kind
+        raise KeyError("unknown artifact kind: " + kind)
+
+    def _list_kind(self, kind):
+        if kind not in self._index:
+            artifacts = []
+            for dir_path, dir_names, file_names in os.walk(self._kind_dir(kind)):
+                dir_names.sort()
+                folder = os.path.basename(dir_path)
+                for file_name in sorted(file_names):
+                    if file_name.startswith('.') or file_name == 'README.md':
+                        continue
+                    match = subject_pattern.match(folder) or subject_pattern.match(file_name)
+                    subject_id = match.group(1) if match else None
+                    artifacts.append(Artifact(os.path.join(dir_path, file_name), subject_id, kind))
+            self._index[kind] = artifacts
+        return self._index[kind]
+
+    def artifacts(self, subject_id=None, kind=None):
+        """
+        generator over the artifacts, optionally of one subject and/or one kind
+        """
+        kinds = self.kinds() if kind is None else [kind]
+        for k in kinds:
+            for artifact in self._list_kind(k):
+                if subject_id is None or artifact.subject_id == subject_id:
+                    yield artifact
+
+    def subjects(self):
+        subject_ids = {artifact.subject_id for artifact in self.artifacts() if artifact.subject_id is not None}
+        return sorted(subject_ids, key=_subject_key)
+
+    def iter_subjects(self, kind=None):
+        """
+        generator of (subject id, list of artifacts), one subject at a time
+        """
+        for subject_id in self.subjects():
+            yield subject_id, list(self.artifacts(subject_id, kind))
+
+    def get(self, subject_id, kind, name):
+        """
+        the artifact of a subject by kind and name, where the name is the file name without the subject prefix, with
+        or without the suffix, e.g. get('m1', 'CleanSegment', 'clean_sacrum_mm') or get('m1', 'Simulation', 'wog_m.xplt')
+        """
+        matches = [artifact for artifact in self.artifacts(subject_id, kind)
+                   if name in (artifact.name, artifact.name + artifact.path.suffix)]
+        if len(matches) == 0:
+            raise KeyError("no artifact %s/%s/%s" % (subject_id, kind, name))
+        if len(matches) > 1:
+            raise KeyError("%s/%s/%s is ambiguous, add the suffix: %s" % (subject_id, kind, name, matches))
+        return matches[0]
+
+    def summary(self):
+        """
+        prints the number of artifacts and the total size per kind, and how many are git-LFS stubs
+        """
+        for kind in self.kinds():
+            artifacts = self._list_kind(kind)
+            lfs = sum(artifact.is_lfs_pointer for artifact in artifacts)
+            size = sum(artifact.size for artifact in artifacts)
+            print(kind, 'files:', len(artifacts), 'lfs stubs:', lfs, 'size: %.1f MB' % (size / 1e6))
@@ -0,0 +1,162 @@
+import numpy as np
+from scipy import sparse
+
+
+class FaceSetMorphology:
+    """
+    Morphology on sets of faces of one triangle mesh. The face-vertex and face-edge incidences are built once as sparse
+    matrices, after that trimming (erosion), one-ring growing (dilation), the inner/outer boundary layers and
+    opening/closing are a few sparse mat-vec products on a mask over all faces.
+
+    A face set is a boolean mask or a count per face (see multiplicity). A face listed twice in a list of face indices
+    counts twice when the boundary edges are determined, the way igl.boundary_facets(faces[face_idxs]) counts it.
+
+    morphology = src.FaceSetMorphology(p_faces, face_adjacency, cumulative_sum)
+    face_set = morphology.multiplicity(p_face_idxs)
+    trim_p_face_idxs = np.flatnonzero(morphology.erode(face_set, 2))
+    grow_p_face_idxs = morphology.grow(p_face_idxs, lambda face_idxs: curvature_value[face_idxs] > 0)
+    """
+
+    def __init__(self, faces, face_adjacency=None, cumulative_sum=None):
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        self.n_faces = len(faces)
+        n_vertices = int(faces.max()) + 1 if self.n_faces else 0
+
+        # vertex -> face, straight from igl.vertex_triangle_adjacency when it is given
+        if face_adjacency is None:
+            vertex_face = sparse.csr_matrix((np.ones(3 * self.n_faces, dtype=np.int32),
+                                             (faces.ravel(), np.repeat(np.arange(self.n_faces), 3))),
+                                            shape=(n_vertices, self.n_faces))
+        else:
+            n_vertices = max(n_vertices, len(cumulative_sum) - 1)
+            indptr = np.concatenate((np.asarray(cumulative_sum, dtype=np.int64),
+                                     np.full(n_vertices + 1 - len(cumulative_sum), cumulative_sum[-1])))
+            vertex_face = sparse.csr_matrix((np.ones(len(face_adjacency), dtype=np.int32),
+                                             np.array(face_adjacency, dtype=np.int64), indptr),
+                                            shape=(n_vertices, self.n_faces))
+
+        # unique undirected edges, every face adds one to each of its three edges
+        corner_edges = np.sort(np.concatenate((faces[:, [1, 2]], faces[:, [2, 0]], faces[:, [0, 1]])), axis=1)
+        keys, edge_idxs = np.unique(corner_edges[:, 0] * max(n_vertices, 1) + corner_edges[:, 1], return_inverse=True)
+        self.edges = np.column_stack((keys // max(n_vertices, 1), keys % max(n_vertices, 1)))
+
+        self.faces = faces
+        self.n_vertices = n_vertices
+        self.vertex_face = vertex_face
+        self.face_vertex = vertex_face.T.tocsr()
+        self.edge_face = sparse.csr_matrix((np.ones(3 * self.n_faces, dtype=np.int32),
+                                            (edge_idxs.ravel(), np.tile(np.arange(self.n_faces), 3))),
+                                           shape=(len(keys), self.n_faces))
+        self.vertex_edge = sparse.csr_matrix((np.ones(2 * len(keys), dtype=np.int32),
+                                              (self.edges.ravel(), np.repeat(np.arange(len(keys)), 2))),
+                                             shape=(n_vertices, len(keys)))
+
+    def mask(self, face_idxs):
+        """
+        :param face_idxs: list of facet indices
+        :return: boolean mask over all faces
+        """
+        mask = np.zeros(self.n_faces, dtype=bool)
+        mask[np.asarray(face_idxs, dtype=np.int64)] = True
+        return mask
+
+    def multiplicity(self, face_idxs):
+        """
+        :param face_idxs: list of facet indices, possibly with repetitions
+        :return: how often each face is listed
+        """
+        return np.bincount(np.asarray(face_idxs, dtype=np.int64), minlength=self.n_faces)
+
+    def boundary_edges(self, face_set):
+        """
+        :param face_set: mask or count per face
+        :return: mask over self.edges, the edges used exactly once by the face set
+        """
+        return self.edge_face @ np.asarray(face_set, dtype=np.int32) == 1
+
+    def boundary_vertices(self, face_set):
+        """
+        :param face_set: mask or count per face
+        :return: mask over all vertices, the vertices on a boundary edge of the face set
+        """
+        return self.vertex_edge @ self.boundary_edges(face_set).astype(np.int32) > 0
+
+    def vertex_star(self, vertex_mask):
+        """
+        :param vertex_mask: mask over all vertices
+        :return: mask over all faces, the faces with at least one vertex in the mask
+        """
+        return self.face_vertex @ np.asarray(vertex_mask, dtype=np.int32) > 0
+
+    def inner_boundary(self, face_set):
+        """
+        the faces of the set that touch its boundary
+        """
+        return self.vertex_star(self.boundary_vertices(face_set)) & (np.asarray(face_set) > 0)
+
+    def outer_boundary(self, face_set):
+        """
+        the faces outside the set that touch its boundary
+        """
+        return self.vertex_star(self.boundary_vertices(face_set)) & ~(np.asarray(face_set) > 0)
+
+    def erode(self, face_set, iterations=1):
+        """
+        removes the inner boundary layer, iterations times
+        """
+        for i in range(iterations):
+            face_set = (np.asarray(face_set) > 0) & ~self.vertex_star(self.boundary_vertices(face_set))
+        return np.asarray(face_set) > 0
+
+    def dilate(self, face_set, iterations=1):
+        """
+        adds the outer boundary layer (the one-ring of the boundary), iterations times
+        """
+        for i in range(iterations):
+            face_set = (np.asarray(face_set) > 0) | self.vertex_star(self.boundary_vertices(face_set))
+        return np.asarray(face_set) > 0
+
+    def open(self, face_set, iterations=1):
+        """
+        erosion followed by dilation, removes thin strips and small islands
+        """
+        return self.dilate(self.erode(face_set, iterations), iterations)
+
+    def close(self, face_set, iterations=1):
+        """
+        dilation followed by erosion, fills narrow gaps and small holes
+        """
+        return self.erode(self.dilate(face_set, iterations), iterations)
+
+    def grow(self, face_idxs, accept, max_rounds=200):
+        """
+        grows a face set ring by ring: every round the faces outside the set that touch its boundary are tested and the
+        accepted ones are added. Only the ring around the faces added in the last round is visited, and every face is
+        tested once, so the cost is linear in the size of the grown region.
+
+        :param face_idxs: list of facet indices of the seed region
+        :param accept: function that takes an array of facet indices and returns a boolean array, True for the faces
+        that may be added
+        :param max_rounds: maximum number of rings to add
+        :return: face_idxs followed by the faces added in each round (sorted within a round)
+        """
+        face_idxs = np.asarray(face_idxs)
+        face_set = self.multiplicity(face_idxs)
+        visited = face_set > 0
+        frontier_face_idxs = np.flatnonzero(self.outer_boundary(face_set))
+
+        grown_face_idxs = [face_idxs]
+        for n in range(max_rounds):
+            frontier_face_idxs = frontier_face_idxs[~visited[frontier_face_idxs]]
+            visited[frontier_face_idxs] = True
+
+            added_face_idxs = frontier_face_idxs[np.asarray(accept(frontier_face_idxs), dtype=bool)]
+            if len(added_face_idxs) == 0:
+                break
+            grown_face_idxs.append(added_face_idxs)
+
+            # the next frontier: the faces around the vertices of the new ring
+            vertex_idxs = np.unique(self.faces[added_face_idxs])
+            frontier_face_idxs = np.unique(self.vertex_face[vertex_idxs].indices)
+
+        return np.concatenate(grown_face_idxs)
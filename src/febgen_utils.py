@@ -9,29 +9,7 @@ import matplotlib.pyplot as plt
 
 import xml.etree.ElementTree as ET
 import xml.dom.minidom
-
-def read_volume_mesh(path, input_dimension, output_dimension):
-    """
-
-    :param path:
-    :return:
-    """
-
-    mesh = meshio.read(path, file_format="gmsh")
-    vertices = mesh.points
-    elements = mesh.get_cells_type("tetra")
-
-    if output_dimension == "m":
-        vertices = vertices / 1000
-
-    # print("number of elements:", len(elements))
-
-    # tet_physical = mesh.cell_data["gmsh:physical"]
-    # domains = np.unique(tet_physical[0])
-
-    # print("the model has this many parts:", domains)
-
-    return vertices, elements
+from xml.sax.saxutils import escape, quoteattr
 
 def xmlElementWriter(xmlElement, fileName):
     """
@@ -55,82 +33,152 @@ def xmlElementWriter(xmlElement, fileName):
     return
 
 
-def getNodeXmlElement(nodeId, nodeCoordinates):
+class _BulkXmlElement(ET.Element):
     """
-    Create a 'node' xml-element that is populated with the given data.
-    Based on tutorials from "http://chms.csuohio.edu/tutorials/Mechanics/FiniteElement/FeBio/PreliminaryTutorials/SimpleBarScriptedGeometry/"
+    An xml-element whose children are kept as a numpy array and formatted only when the file is written.
+    """
+    pass
 
-    The xml-element that is returned is something similar to this:
-        <node id="1">0., 0., 0.</node>
 
-    :param nodeId: int, The integer that is used to identify the node in the finite element mesh.
-    :param nodeCoordinates: array 1x3, The coordinates of the node in the finite element mesh.
-    :return:
+def _getBulkXmlElement(tag, attributeData, childTag, childFormat, ids, values):
+
+    xmlElement = _BulkXmlElement(tag, attributeData)
+    xmlElement.childTag = childTag
+    xmlElement.childFormat = childFormat
+    xmlElement.ids = np.asarray(ids)
+    xmlElement.values = None if values is None else np.asarray(values)
+
+    return xmlElement
+
+
+def getNodesXmlElement(name, nodeCoordinates, firstId=1, floatFormat='%r'):
     """
-    # Convert 'nodeId' to a string value.
-    # Notice how overwriting the original value in 'nodeId' with a string value.
-    nodeId = str(nodeId)
-    # Define a dictionary with a key called 'id'.
-    attributeData = {'id': nodeId}
-    element = ET.Element('node',
-                         attributeData)  # Create an xml-element with a tag of 'node' and attributes defines with the 'attributeData' dictionary.
-    # Notice here how the values in braces {} are converted into strings automatically.
-    # The values outside the braces remain part of the string.
-    element.text = f'{nodeCoordinates[0]}, {nodeCoordinates[1]}, {nodeCoordinates[2]}'  # Define the text value for the 'barNodesChild' xml-element.
-
-    return element
-
-def getSurfaceXmlElement(nodeId, surfaceDefinition):
-
-    # Based on tutorials from "http://chms.csuohio.edu/tutorials/Mechanics/FiniteElement/FeBio/PreliminaryTutorials/SimpleBarScriptedGeometry/"
-    # """
-    # Create a 'node' xml-element that is populated with the given data.
-    #
-    # The xml-element that is returned is something similar to this:
-    #     <node id="1">0., 0., 0.</node>
-    #
-    # :param nodeId: int, The integer that is used to identify the node in the finite element mesh.
-    # :param nodeCoordinates: array 1x3, The coordinates of the node in the finite element mesh.
-    # :return:
-    # """
-    # Convert 'nodeId' to a string value.
-    # Notice how overwriting the original value in 'nodeId' with a string value.
-    nodeId = str(nodeId)
-    # Define a dictionary with a key called 'id'.
-    attributeData = {'id': nodeId}
-    element = ET.Element('tri3',
-                         attributeData)  # Create an xml-element with a tag of 'node' and attributes defines with the 'attributeData' dictionary.
-    # Notice here how the values in braces {} are converted into strings automatically.
-    # The values outside the braces remain part of the string.
-    element.text = f'{ surfaceDefinition[0]}, {surfaceDefinition[1]}, {surfaceDefinition[2]}'  # Define the text value for the 'barNodesChild' xml-element.
-
-    return element
-
-
-def getElemXmlElement(elementId, elementDefinition):
+    Create a 'Nodes' xml-element that holds all of the given nodes. The 'node' children are not built as separate
+    xml-elements, they are written in chunks by xmlStreamWriter.
+
+    The xml-element that is written is something similar to this:
+        <Nodes name="part">
+            <node id="1">0, 0, 0</node>
+            ...
+        </Nodes>
+
+    :param name: string, The name of the part.
+    :param nodeCoordinates: array nx3, The coordinates of the nodes.
+    :param firstId: int, The id of the first node, the rest are numbered consecutively.
+    :param floatFormat: string, printf-style format of each coordinate. '%r' writes the shortest text that reads back
+                        as the same double, e.g. '%.6g' gives smaller files at reduced precision.
+    :return: xml.etree.ElementTree.Element instance
     """
-    Create a 'elem' xml-element that is populated with the given data.
-    Based on tutorials from "http://chms.csuohio.edu/tutorials/Mechanics/FiniteElement/FeBio/PreliminaryTutorials/SimpleBarScriptedGeometry/"
+    nodeCoordinates = np.asarray(nodeCoordinates)
+    ids = np.arange(firstId, firstId + len(nodeCoordinates))
+    childFormat = '<node id="%d">' + ', '.join([floatFormat] * 3) + '</node>'
+
+    return _getBulkXmlElement('Nodes', {'name': name}, 'node', childFormat, ids, nodeCoordinates)
 
-    The xml-element that is returned is something similar to this:
-        <elem id="1">4, 3, 10, 9, 8, 7, 11, 12</elem>
 
-    :param elementId: int, The integer that is assigned to the xml-attribute "id=elementId"
-    :param elementDefinition: array 1xn, An array of 'n' integers. These integers are used as the 'elem' xml-element's text, which is a comma separated list.
-    :return: xml.etree.ElementTree.Element instance, An xml-element that is populated with the given data.
+def getElementsXmlElement(attributeData, elementDefinitions, firstId=1):
     """
-    # Two operations are happening in this line in the following order:
-    #   1) str(elementId)   elementId is converted to a string.
-    #       Notice how the results of this operation are not used to define a variable, rather they are used as the input for the next operation.
-    #   2) {'id':str(elementId)}    A dictionary with one entry is generated. We are giving that entry a key of 'id'.
-    #       Notice how the results of the previous operation are supplying the value for the entry.
-    elementData = {'id':str(elementId)}
-    xmlElement = ET.Element('elem', elementData) # Define the xml-element.
-
-    # Specify the text for 'xmlElement'
-    txt = '' # Initialize an empty string
-    for i in range(len(elementDefinition)):
-        txt = txt + f'{elementDefinition[i]}, '
-    txt = txt.rstrip(', ')
-    xmlElement.text = txt
-    return xmlElement
+    Create an 'Elements' xml-element that holds all of the given elements. The 'elem' children are written in chunks
+    by xmlStreamWriter.
+
+    The xml-element that is written is something similar to this:
+        <Elements type="tet4" mat="1" name="part">
+            <elem id="1">1, 2, 3, 4</elem>
+            ...
+        </Elements>
+
+    :param attributeData: dictionary, The attributes of the 'Elements' xml-element, e.g. {'type':'tet4', 'mat':'1', 'name':'part'}.
+    :param elementDefinitions: array nxm, The (one-based) node ids of each element.
+    :param firstId: int, The id of the first element, the rest are numbered consecutively.
+    :return: xml.etree.ElementTree.Element instance
+    """
+    elementDefinitions = np.asarray(elementDefinitions)
+    ids = np.arange(firstId, firstId + len(elementDefinitions))
+    childFormat = '<elem id="%d">' + ', '.join(['%d'] * elementDefinitions.shape[1]) + '</elem>'
+
+    return _getBulkXmlElement('Elements', attributeData, 'elem', childFormat, ids, elementDefinitions)
+
+
+def getTriSurfaceXmlElement(name, surfaceDefinitions):
+    """
+    Create a 'Surface' xml-element that holds all of the given triangles. The 'tri3' children are numbered from one
+    and written in chunks by xmlStreamWriter.
+
+    :param name: string, The name of the surface.
+    :param surfaceDefinitions: array nx3, The (one-based) node ids of each triangle.
+    :return: xml.etree.ElementTree.Element instance
+    """
+    surfaceDefinitions = np.asarray(surfaceDefinitions)
+    ids = np.arange(1, len(surfaceDefinitions) + 1)
+    childFormat = '<tri3 id="%d">%d, %d, %d</tri3>'
+
+    return _getBulkXmlElement('Surface', {'name': name}, 'tri3', childFormat, ids, surfaceDefinitions)
+
+
+def getNodeSetXmlElement(name, nodeIds):
+    """
+    Create a 'NodeSet' xml-element that holds all of the given (one-based) node ids.
+
+    :param name: string, The name of the node set.
+    :param nodeIds: array 1xn, The node ids.
+    :return: xml.etree.ElementTree.Element instance
+    """
+    return _getBulkXmlElement('NodeSet', {'name': name}, 'node', '<node id="%d"/>', nodeIds, None)
+
+
+def _writeBulkChildren(fl, xmlElement, indent, chunkSize):
+
+    n = len(xmlElement.ids)
+
+    for start in range(0, n, chunkSize):
+        stop = min(start + chunkSize, n)
+        if xmlElement.values is None:
+            rows = xmlElement.ids[start:stop, None]
+        else:
+            rows = np.column_stack((xmlElement.ids[start:stop], xmlElement.values[start:stop]))
+        # one printf call per chunk instead of one xml-element per row
+        lineFormat = indent + xmlElement.childFormat + '\n'
+        fl.write((lineFormat * (stop - start)) % tuple(rows.ravel().tolist()))
+
+
+def _writeXmlElement(fl, xmlElement, depth, chunkSize):
+
+    indent = '\t' * depth
+    attributes = ''.join(' %s=%s' % (key, quoteattr(str(value))) for key, value in xmlElement.attrib.items())
+    text = xmlElement.text
+    children = list(xmlElement)
+    isBulk = isinstance(xmlElement, _BulkXmlElement) and len(xmlElement.ids) > 0
+
+    if not children and not isBulk:
+        if text:
+            fl.write('%s<%s%s>%s</%s>\n' % (indent, xmlElement.tag, attributes, escape(text), xmlElement.tag))
+        else:
+            fl.write('%s<%s%s/>\n' % (indent, xmlElement.tag, attributes))
+        return
+
+    fl.write('%s<%s%s>\n' % (indent, xmlElement.tag, attributes))
+    if text:
+        fl.write('%s\t%s\n' % (indent, escape(text)))
+    if isBulk:
+        _writeBulkChildren(fl, xmlElement, indent + '\t', chunkSize)
+    for child in children:
+        _writeXmlElement(fl, child, depth + 1, chunkSize)
+    fl.write('%s</%s>\n' % (indent, xmlElement.tag))
+
+
+def xmlStreamWriter(xmlElement, fileName, chunkSize=100000):
+    """
+    Write the given XML-element to a file, in the same layout as xmlElementWriter, without building the whole document
+    in memory. The elements made by getNodesXmlElement, getElementsXmlElement, getTriSurfaceXmlElement and
+    getNodeSetXmlElement are formatted straight from their numpy arrays, chunkSize rows at a time.
+
+    :param xmlElement: xml.etree.ElementTree.Element instance, The XML-element that contains all of the data that is being written.
+    :param fileName: string, The name of the file that is being generated. Note that if this fileName already exists, then that file will be overwritten without warning.
+    :param chunkSize: int, The number of rows that are formatted and written at once.
+    :return:
+    """
+    with open(fileName, mode='w', encoding='ISO-8859-1', newline='\n') as fl:
+        fl.write('<?xml version="1.0" encoding="ISO-8859-1"?>\n')
+        _writeXmlElement(fl, xmlElement, 0, chunkSize)
+
+    return
@@ -0,0 +1,557 @@
+import mmap
+import re
+import struct
+import numpy as np
+import pandas as pd
+
+
+# FEBio plotfile (.xplt) block ids
+PLT_MAGIC = 0x00464542
+
+PLT_ROOT = 0x01000000
+PLT_HEADER = 0x01010000
+PLT_HDR_VERSION = 0x01010001
+PLT_HDR_NODES = 0x01010002
+PLT_HDR_COMPRESSION = 0x01010004
+
+PLT_DICTIONARY = 0x01020000
+PLT_DIC_ITEM = 0x01020001
+PLT_DIC_ITEM_TYPE = 0x01020002
+PLT_DIC_ITEM_FMT = 0x01020003
+PLT_DIC_ITEM_NAME = 0x01020004
+PLT_DIC_ITEM_ARRAYSIZE = 0x01020005
+PLT_DIC_GLOBAL = 0x01021000
+PLT_DIC_MATERIAL = 0x01022000
+PLT_DIC_NODAL = 0x01023000
+PLT_DIC_DOMAIN = 0x01024000
+PLT_DIC_SURFACE = 0x01025000
+
+PLT_GEOMETRY = 0x01040000
+PLT_NODE_SECTION = 0x01041000
+PLT_NODE_HEADER = 0x01041100
+PLT_NODE_SIZE = 0x01041101
+PLT_NODE_DIM = 0x01041102
+PLT_NODE_COORDS_2 = 0x01041001
+PLT_NODE_COORDS_3 = 0x01041200
+PLT_DOMAIN_SECTION = 0x01042000
+PLT_DOMAIN = 0x01042100
+PLT_DOMAIN_HDR = 0x01042101
+PLT_DOM_ELEM_TYPE = 0x01042102
+PLT_DOM_MAT_ID = 0x01042103
+PLT_DOM_ELEMS = (0x01032104, 0x01042104)
+PLT_DOM_NAME = (0x01032105, 0x01042105)
+PLT_DOM_ELEM_LIST = 0x01042200
+PLT_SURFACE_SECTION = 0x01043000
+PLT_SURFACE = 0x01043100
+PLT_SURFACE_HDR = 0x01043101
+PLT_SURFACE_ID = 0x01043102
+PLT_SURFACE_FACES = 0x01043103
+PLT_SURFACE_NAME = 0x01043104
+
+PLT_STATE = 0x02000000
+PLT_STATE_HEADER = 0x02010000
+PLT_STATE_HDR_TIME = 0x02010002
+PLT_STATE_DATA = 0x02020000
+PLT_STATE_VARIABLE = 0x02020001
+PLT_STATE_VAR_ID = 0x02020002
+PLT_STATE_VAR_DATA = 0x02020003
+
+# dictionary category -> state data block
+plt_categories = {PLT_DIC_GLOBAL: ('global', 0x02020100),
+                  PLT_DIC_MATERIAL: ('material', 0x02020200),
+                  PLT_DIC_NODAL: ('node', 0x02020300),
+                  PLT_DIC_DOMAIN: ('domain', 0x02020400),
+                  PLT_DIC_SURFACE: ('surface', 0x02020500)}
+
+# number of floats per value: FLOAT, VEC3F, MAT3FS, MAT3FD, TENS4FS, MAT3F
+plt_type_sizes = {0: 1, 1: 3, 2: 6, 3: 3, 4: 21, 5: 9}
+
+plt_formats = {0: 'node', 1: 'item', 2: 'mult', 3: 'region'}
+
+
+def _chunks(buffer, start, end):
+
+    """
+    This function walks the blocks between start and end of an xplt file, without reading their content
+
+    :param buffer: the memory-mapped file
+    :param start: offset of the first block
+    :param end: offset where the blocks stop
+    :return: generator of (block id, offset of the block data, size of the block data)
+    """
+
+    offset = start
+    while offset + 8 <= end:
+        block_id, size = struct.unpack_from('<II', buffer, offset)
+        yield block_id, offset + 8, size
+        offset += 8 + size
+
+
+def _find(buffer, start, end, block_id):
+
+    for chunk_id, offset, size in _chunks(buffer, start, end):
+        if chunk_id == block_id:
+            return offset, size
+
+    return None, None
+
+
+def _uint(buffer, offset):
+
+    return struct.unpack_from('<I', buffer, offset)[0]
+
+
+def _string(buffer, offset, size, version):
+
+    if version >= 0x30:
+        # length-prefixed strings
+        length = _uint(buffer, offset)
+        raw = buffer[offset + 4:offset + 4 + length]
+    else:
+        # fixed char[64]
+        raw = buffer[offset:offset + size]
+
+    return raw.split(b'\x00')[0].decode('ascii', 'replace')
+
+
+def von_mises(stress):
+
+    """
+    This function computes the von Mises stress from symmetric stress values in FEBio order (xx, yy, zz, xy, yz, xz)
+
+    :param stress: array (..., 6)
+    :return: array (...)
+    """
+
+    stress = np.asarray(stress, dtype=np.float64)
+    xx, yy, zz, xy, yz, xz = [stress[..., k] for k in range(6)]
+
+    return np.sqrt(0.5 * ((xx - yy) ** 2 + (yy - zz) ** 2 + (zz - xx) ** 2) + 3.0 * (xy ** 2 + yz ** 2 + xz ** 2))
+
+
+class XpltReader:
+    """
+    A reader for FEBio plotfiles. The file is memory-mapped. Opening it only reads the header, the dictionary, the
+    domain headers and the block headers of every state, and the arrays that are returned are views into the file, so
+    only the bytes that are used are read from disk.
+
+    plot = src.XpltReader('m1_wog_m.xplt')
+    stress = plot.data('stress', state=-1, region=1)               # (elements of domain 1, 6)
+    history = plot.element_history('stress', region=1, index=100)  # (states, 6)
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, 'rb')
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if _uint(self._buffer, 0) != PLT_MAGIC:
+            raise ValueError("not an FEBio plotfile: " + self.path)
+
+        self.version = 0
+        self.compression = 0
+        self.n_nodes = 0
+        self.variables = {}
+        self.domains = []
+        self.surfaces = []
+        self._node_coords = None
+        self._states = []
+
+        end = len(self._buffer)
+        for block_id, offset, size in _chunks(self._buffer, 4, end):
+            if block_id == PLT_ROOT:
+                self._read_root(offset, offset + size)
+            elif block_id == PLT_GEOMETRY:
+                # FEBio 3 writes the mesh as a block of its own between the root and the states
+                self._read_geometry(offset, offset + size)
+            elif block_id == PLT_STATE:
+                self._index_state(offset, offset + size)
+
+        self.times = np.array([state[0] for state in self._states])
+
+    def close(self):
+        # arrays returned by the reader are views into the file, drop them (or copy them) before closing
+        self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def n_states(self):
+        return len(self._states)
+
+    def _read_root(self, start, end):
+        buffer = self._buffer
+
+        for block_id, offset, size in _chunks(buffer, start, end):
+            if block_id == PLT_HEADER:
+                for item_id, item_offset, item_size in _chunks(buffer, offset, offset + size):
+                    if item_id == PLT_HDR_VERSION:
+                        self.version = _uint(buffer, item_offset)
+                    elif item_id == PLT_HDR_NODES:
+                        self.n_nodes = _uint(buffer, item_offset)
+                    elif item_id == PLT_HDR_COMPRESSION:
+                        self.compression = _uint(buffer, item_offset)
+            elif block_id == PLT_DICTIONARY:
+                self._read_dictionary(offset, offset + size)
+            elif block_id == PLT_GEOMETRY:
+                self._read_geometry(offset, offset + size)
+
+        if self.compression != 0:
+            raise ValueError("compressed plotfiles can not be memory-mapped, write the plotfile with compression "
+                             "off: " + self.path)
+
+    def _read_dictionary(self, start, end):
+        buffer = self._buffer
+
+        for category_id, offset, size in _chunks(buffer, start, end):
+            if category_id not in plt_categories:
+                continue
+            category = plt_categories[category_id][0]
+            for var_id, (_, item_offset, item_size) in enumerate(_chunks(buffer, offset, offset + size), 1):
+                item = {'category': category, 'id': var_id, 'type': 0, 'format': 'item', 'array_size': 0}
+                for field_id, field_offset, field_size in _chunks(buffer, item_offset, item_offset + item_size):
+                    if field_id == PLT_DIC_ITEM_TYPE:
+                        item['type'] = _uint(buffer, field_offset)
+                    elif field_id == PLT_DIC_ITEM_FMT:
+                        item['format'] = plt_formats.get(_uint(buffer, field_offset), 'unknown')
+                    elif field_id == PLT_DIC_ITEM_ARRAYSIZE:
+                        item['array_size'] = _uint(buffer, field_offset)
+                    elif field_id == PLT_DIC_ITEM_NAME:
+                        item['name'] = _string(buffer, field_offset, field_size, self.version)
+                item['components'] = plt_type_sizes.get(item['type'], max(item['array_size'], 1))
+                if item['type'] == 7:
+                    item['components'] = 3 * item['array_size']
+                self.variables[item['name']] = item
+
+    def _read_geometry(self, start, end):
+        buffer = self._buffer
+
+        for block_id, offset, size in _chunks(buffer, start, end):
+            if block_id == PLT_NODE_SECTION:
+                dim = 3
+                for node_id, node_offset, node_size in _chunks(buffer, offset, offset + size):
+                    if node_id == PLT_NODE_HEADER:
+                        for field_id, field_offset, field_size in _chunks(buffer, node_offset, node_offset + node_size):
+                            if field_id == PLT_NODE_SIZE:
+                                self.n_nodes = _uint(buffer, field_offset)
+                            elif field_id == PLT_NODE_DIM:
+                                dim = _uint(buffer, field_offset)
+                    elif node_id == PLT_NODE_COORDS_2:
+                        self._node_coords = (node_offset, node_size, 0, dim)
+                    elif node_id == PLT_NODE_COORDS_3:
+                        # every node is stored with its id in front of the coordinates
+                        self._node_coords = (node_offset, node_size, 1, dim)
+
+            elif block_id == PLT_DOMAIN_SECTION:
+                for domain_id, domain_offset, domain_size in _chunks(buffer, offset, offset + size):
+                    if domain_id != PLT_DOMAIN:
+                        continue
+                    domain = {'name': '', 'elem_type': None, 'mat_id': None, 'n_elems': 0, 'elements': None}
+                    for part_id, part_offset, part_size in _chunks(buffer, domain_offset, domain_offset + domain_size):
+                        if part_id == PLT_DOMAIN_HDR:
+                            for field_id, field_offset, field_size in _chunks(buffer, part_offset,
+                                                                              part_offset + part_size):
+                                if field_id == PLT_DOM_ELEM_TYPE:
+                                    domain['elem_type'] = _uint(buffer, field_offset)
+                                elif field_id == PLT_DOM_MAT_ID:
+                                    domain['mat_id'] = _uint(buffer, field_offset)
+                                elif field_id in PLT_DOM_ELEMS:
+                                    domain['n_elems'] = _uint(buffer, field_offset)
+                                elif field_id in PLT_DOM_NAME:
+                                    domain['name'] = _string(buffer, field_offset, field_size, self.version)
+                        elif part_id == PLT_DOM_ELEM_LIST:
+                            domain['elements'] = (part_offset, part_size)
+                    self.domains.append(domain)
+
+            elif block_id == PLT_SURFACE_SECTION:
+                for surface_id, surface_offset, surface_size in _chunks(buffer, offset, offset + size):
+                    if surface_id != PLT_SURFACE:
+                        continue
+                    surface = {'id': None, 'name': '', 'n_faces': 0}
+                    header_offset, header_size = _find(buffer, surface_offset, surface_offset + surface_size,
+                                                       PLT_SURFACE_HDR)
+                    if header_offset is not None:
+                        for field_id, field_offset, field_size in _chunks(buffer, header_offset,
+                                                                          header_offset + header_size):
+                            if field_id == PLT_SURFACE_ID:
+                                surface['id'] = _uint(buffer, field_offset)
+                            elif field_id == PLT_SURFACE_FACES:
+                                surface['n_faces'] = _uint(buffer, field_offset)
+                            elif field_id == PLT_SURFACE_NAME:
+                                surface['name'] = _string(buffer, field_offset, field_size, self.version)
+                    self.surfaces.append(surface)
+
+    def _index_state(self, start, end):
+        buffer = self._buffer
+        time = None
+        variables = {}
+
+        for block_id, offset, size in _chunks(buffer, start, end):
+            if block_id == PLT_STATE_HEADER:
+                time_offset, _ = _find(buffer, offset, offset + size, PLT_STATE_HDR_TIME)
+                if time_offset is not None:
+                    time = struct.unpack_from('<f', buffer, time_offset)[0]
+            elif block_id == PLT_STATE_DATA:
+                for data_id, data_offset, data_size in _chunks(buffer, offset, offset + size):
+                    for var_block, var_offset, var_size in _chunks(buffer, data_offset, data_offset + data_size):
+                        if var_block != PLT_STATE_VARIABLE:
+                            continue
+                        var_id = None
+                        regions = {}
+                        for field_id, field_offset, field_size in _chunks(buffer, var_offset, var_offset + var_size):
+                            if field_id == PLT_STATE_VAR_ID:
+                                var_id = _uint(buffer, field_offset)
+                            elif field_id == PLT_STATE_VAR_DATA:
+                                # one (region id, byte size, floats) record per domain/surface
+                                for region_id, region_offset, region_size in _chunks(buffer, field_offset,
+                                                                                     field_offset + field_size):
+                                    regions[region_id] = (region_offset, region_size // 4)
+                        variables[(data_id, var_id)] = regions
+
+        self._states.append((time, variables))
+
+    def nodes(self):
+        """
+        the node coordinates, (n_nodes, 3) float32
+        """
+        if self._node_coords is None:
+            return None
+        offset, size, with_ids, dim = self._node_coords
+        values = np.frombuffer(self._buffer, dtype='<f4', count=size // 4, offset=offset)
+        if with_ids:
+            return values.reshape(-1, dim + 1)[:, 1:]
+        return values.reshape(-1, dim)
+
+    def elements(self, domain):
+        """
+        the element ids and node indices of a domain, taken from the element list as one strided view
+
+        :param domain: zero-based domain index
+        :return: element ids (n,), node indices as stored by FEBio (zero-based) (n, nodes per element)
+        """
+        offset, size = self.domains[domain]['elements']
+        n_elems = self.domains[domain]['n_elems']
+        if n_elems == 0:
+            return np.zeros(0, dtype='<i4'), np.zeros((0, 0), dtype='<i4')
+        # every element is a block: id, size, element id, node ids. The stride comes from the size in the header of the
+        # first block, and all blocks of a domain have the same size
+        stride = (8 + _uint(self._buffer, offset + 4)) // 4
+        if n_elems * stride * 4 != size:
+            raise ValueError("element list of domain " + str(domain) + " does not hold " + str(n_elems) +
+                             " elements of the same size: " + self.path)
+        values = np.frombuffer(self._buffer, dtype='<i4', count=n_elems * stride, offset=offset).reshape(n_elems, stride)
+        return values[:, 2], values[:, 3:]
+
+    def _variable(self, name):
+        if name not in self.variables:
+            raise KeyError("unknown variable %s, the file has: %s" % (name, ', '.join(self.variables)))
+        item = self.variables[name]
+        data_id = [block for category, block in plt_categories.values() if category == item['category']][0]
+        return item, (data_id, item['id'])
+
+    def regions(self, name, state=0):
+        """
+        the region ids (domains or surfaces, one-based) that hold data of a variable in a state
+        """
+        _, key = self._variable(name)
+        return sorted(self._states[state][1].get(key, {}))
+
+    def data(self, name, state, region=None):
+        """
+        the values of a variable in one state, as a view into the file
+
+        :param name: the variable name from the dictionary, e.g. 'stress', 'displacement', 'contact pressure'
+        :param state: state index, negative indices count from the end
+        :param region: one-based domain/surface id, by default the first region that holds data
+        :return: array (values, components)
+        """
+        item, key = self._variable(name)
+        regions = self._states[state][1].get(key, {})
+        if not regions:
+            raise KeyError("%s is not stored in state %d" % (name, state))
+        if region is None:
+            region = min(regions)
+        offset, count = regions[region]
+        values = np.frombuffer(self._buffer, dtype='<f4', count=count, offset=offset)
+        return values.reshape(-1, item['components'])
+
+    def history(self, name, region=None, index=slice(None)):
+        """
+        the values of a variable for the given item(s) of a region over all states, only those bytes are read
+
+        :param name: the variable name
+        :param region: one-based domain/surface id
+        :param index: item index (or slice/array of indices) inside the region
+        :return: array (states, ...)
+        """
+        return np.stack([np.array(self.data(name, state, region)[index]) for state in range(self.n_states)])
+
+    def element_history(self, name, region, index):
+        """
+        the values of an element variable of one element over all states
+
+        :param name: the variable name, e.g. 'stress'
+        :param region: one-based domain id
+        :param index: zero-based element index inside the domain
+        :return: array (states, components)
+        """
+        return self.history(name, region, index)
+
+
+log_number = r'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+
+log_patterns = {
+    'step': re.compile(r'beginning time step\s+(\d+)\s*:\s*' + log_number),
+    'iteration': re.compile(r'Nonlinear solution status:\s*time\s*=\s*' + log_number),
+    'stiffness_updates': re.compile(r'stiffness updates\s*=\s*(\d+)'),
+    'rhs_evaluations': re.compile(r'right hand side evaluations\s*=\s*(\d+)'),
+    'reformations': re.compile(r'stiffness matrix reformations\s*=\s*(\d+)'),
+    'norm': re.compile(r'^\s*(residual|energy|displacement)\s+' + log_number + r'\s+' + log_number + r'\s+' +
+                       log_number),
+    'augmentation': re.compile(r'augmentation\s*#\s*(\d+)'),
+    'converged': re.compile(r'converged at time\s*:\s*' + log_number),
+    'failed': re.compile(r'failed to converge at time\s*:\s*' + log_number),
+    'timer': re.compile(r'^\s*([A-Za-z][A-Za-z ,()\-]*?)\s*\.*\s*:\s*(\d+):(\d+):(\d+)(?:\s*\(\s*' + log_number +
+                        r'\s*sec\))?'),
+    'termination': re.compile(r'([A-Z](?: [A-Z])+)\s+T E R M I N A T I O N'),
+}
+
+
+def _new_log_step(step, time):
+
+    return {'step': step, 'time': time, 'converged': False, 'iterations': 0, 'reformations': 0,
+            'stiffness_updates': 0, 'rhs_evaluations': 0, 'augmentations': 0,
+            'residual_initial': np.nan, 'residual': np.nan, 'energy_initial': np.nan, 'energy': np.nan,
+            'displacement_initial': np.nan, 'displacement': np.nan}
+
+
+def iter_febio_log(path, summary=None):
+
+    """
+    This function reads an FEBio log file line by line and yields one record per time step attempt, so the whole log
+    is never held in memory. A step that had to be retried shows up once per attempt with converged=False.
+
+    :param path: path to the .log file
+    :param summary: optional dictionary that is filled with the timers (in seconds) and the termination status
+    :return: generator of dictionaries with the step, time, converged, Newton iterations, reformations, stiffness
+             updates, right hand side evaluations, contact augmentations and the initial/last convergence norms
+    """
+
+    if summary is None:
+        summary = {}
+
+    step = None
+
+    with open(path, 'r', errors='replace') as log_file:
+        for line in log_file:
+
+            match = log_patterns['step'].search(line)
+            if match:
+                if step is not None:
+                    yield step
+                step = _new_log_step(int(match.group(1)), float(match.group(2)))
+                continue
+
+            if step is not None:
+                if log_patterns['iteration'].search(line):
+                    step['iterations'] += 1
+                    continue
+
+                match = log_patterns['norm'].match(line)
+                if match:
+                    name = match.group(1)
+                    if np.isnan(step[name + '_initial']):
+                        step[name + '_initial'] = float(match.group(2))
+                    step[name] = float(match.group(3))
+                    continue
+
+                # these counters are cumulative within a step, keep the last one
+                counter = None
+                for name in ('reformations', 'stiffness_updates', 'rhs_evaluations'):
+                    match = log_patterns[name].search(line)
+                    if match:
+                        step[name] = int(match.group(1))
+                        counter = name
+                        break
+                if counter is not None:
+                    continue
+
+                if log_patterns['augmentation'].search(line):
+                    step['augmentations'] += 1
+                    continue
+
+                if log_patterns['converged'].search(line):
+                    step['converged'] = True
+                    yield step
+                    step = None
+                    continue
+
+                if log_patterns['failed'].search(line):
+                    yield step
+                    step = None
+                    continue
+
+            match = log_patterns['timer'].match(line)
+            if match:
+                name = match.group(1).strip().lower().replace(' ', '_')
+                seconds = match.group(5)
+                if seconds is None:
+                    seconds = int(match.group(2)) * 3600 + int(match.group(3)) * 60 + int(match.group(4))
+                summary[name] = float(seconds)
+                continue
+
+            match = log_patterns['termination'].search(line)
+            if match:
+                summary['termination'] = match.group(1).replace(' ', '').lower()
+
+    if step is not None:
+        yield step
+
+
+def read_febio_log(path):
+
+    """
+    This function parses an FEBio log file into a table with one row per time step attempt
+
+    :param path: path to the .log file
+    :return: pandas DataFrame of the steps, dictionary of the timers (seconds) and the termination status
+    """
+
+    summary = {}
+    steps = pd.DataFrame(list(iter_febio_log(path, summary)),
+                         columns=list(_new_log_step(0, 0.0).keys()))
+
+    return steps, summary
+
+
+def compare_febio_logs(paths):
+
+    """
+    This function summarizes several FEBio log files, e.g. the resolutions of the convergence study, in one table
+
+    :param paths: dictionary of name -> path to the .log file
+    :return: pandas DataFrame with one row per log
+    """
+
+    rows = []
+
+    for name, path in paths.items():
+        steps, summary = read_febio_log(path)
+        converged = steps[steps['converged']]
+        row = {'name': name,
+               'steps': len(converged),
+               'failed_attempts': int((~steps['converged']).sum()),
+               'iterations': int(steps['iterations'].sum()),
+               'reformations': int(steps['reformations'].sum()),
+               'augmentations': int(steps['augmentations'].sum()),
+               'mean_iterations': converged['iterations'].mean() if len(converged) else np.nan,
+               'termination': summary.get('termination')}
+        row.update({key: value for key, value in summary.items() if key != 'termination'})
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index('name')
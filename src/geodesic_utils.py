@@ -0,0 +1,167 @@
+import numpy as np
+import igl
+from scipy import sparse
+from scipy.sparse.linalg import splu
+from scipy.spatial import cKDTree
+from src.faceset_utils import FaceSetMorphology
+
+
+# above this number of faces in the region, method='auto' switches from the exact solver to the heat method
+exact_max_faces = 50000
+
+
+class PatchGeodesic:
+    """
+    Geodesic distance to a set of source vertices (e.g. the boundary of a cartilage patch), computed on the patch only
+    and only as far as a cutoff. A path of length d stays within the euclidean distance d of its source, so the region
+    is grown from the sources over the patch faces that come closer than the cutoff, and everything beyond it is left
+    out. Distances are computed either exactly (igl.exact_geodesic, MMP) or with the heat method, whose two
+    factorizations are computed once and kept.
+
+    geodesic = src.PatchGeodesic(p_vertices, s_faces, s_face_idxs, s_edge_vertex_idxs, param.bandwidth)
+    dist_to_s_boundary = geodesic.distance()
+    geodesic.compare('heat')
+    """
+
+    def __init__(self, vertices, faces, face_idxs, source_vertex_idxs, cutoff):
+        vertices = np.asarray(vertices, dtype=np.float64)
+        faces = np.asarray(faces, dtype=np.int64)
+        face_idxs = np.unique(np.asarray(face_idxs, dtype=np.int64))
+        source_vertex_idxs = np.unique(np.asarray(source_vertex_idxs, dtype=np.int64))
+
+        self.n_vertices = len(vertices)
+        self.cutoff = cutoff
+        self._heat = None
+
+        # euclidean distance of every patch vertex to the closest source, a lower bound of the geodesic distance
+        patch_faces = faces[face_idxs]
+        euclidean = np.full(len(vertices), np.inf)
+        patch_vertex_idxs = np.unique(patch_faces)
+        if len(source_vertex_idxs) != 0:
+            euclidean[patch_vertex_idxs] = cKDTree(vertices[source_vertex_idxs]).query(vertices[patch_vertex_idxs])[0]
+
+        # a face can hold a point closer than the cutoff when its closest corner is within the cutoff plus its longest edge
+        corners = vertices[patch_faces]
+        longest_edge = np.max(np.linalg.norm(corners - np.roll(corners, 1, axis=1), axis=2), axis=1)
+        reachable = np.zeros(len(faces), dtype=bool)
+        reachable[face_idxs] = np.min(euclidean[patch_faces], axis=1) - longest_edge <= cutoff
+
+        # grow from the faces around the sources, so parts of the patch that no path can reach are left out
+        morphology = FaceSetMorphology(faces[face_idxs])
+        seed_mask = np.isin(patch_faces, source_vertex_idxs).any(axis=1) & reachable[face_idxs]
+        grown = morphology.grow(np.flatnonzero(seed_mask), lambda idxs: reachable[face_idxs[idxs]],
+                                max_rounds=len(face_idxs))
+        region_face_idxs = np.sort(face_idxs[grown])
+
+        # faces that only touch the region at a vertex form components of their own that the solvers can not reach
+        if len(region_face_idxs) != 0:
+            components = igl.face_components(faces[region_face_idxs])
+            source_components = np.unique(components[np.isin(faces[region_face_idxs], source_vertex_idxs).any(axis=1)])
+            region_face_idxs = region_face_idxs[np.isin(components, source_components)]
+        self.region_face_idxs = region_face_idxs
+
+        # the region as a mesh of its own
+        self.region_vertex_idxs, region_faces = np.unique(faces[self.region_face_idxs], return_inverse=True)
+        self.region_vertices = vertices[self.region_vertex_idxs]
+        self.region_faces = region_faces.reshape(-1, 3)
+        self.region_source_idxs = np.flatnonzero(np.isin(self.region_vertex_idxs, source_vertex_idxs))
+
+    def _exact(self):
+        return igl.exact_geodesic(self.region_vertices, self.region_faces, self.region_source_idxs,
+                                  np.arange(len(self.region_vertices)))
+
+    def _heat_factors(self):
+
+        # the heat flow and the poisson system only depend on the region, they are factorized once
+        if self._heat is None:
+            laplacian = -igl.cotmatrix(self.region_vertices, self.region_faces)
+            mass = igl.massmatrix(self.region_vertices, self.region_faces, igl.MASSMATRIX_TYPE_VORONOI)
+            edges = igl.edges(self.region_faces)
+            h = np.mean(np.linalg.norm(self.region_vertices[edges[:, 0]] - self.region_vertices[edges[:, 1]], axis=1))
+
+            # the distance is zero on the sources, the poisson problem is solved for the other vertices
+            free_idxs = np.setdiff1d(np.arange(len(self.region_vertices)), self.region_source_idxs)
+            poisson = laplacian.tocsr()[free_idxs][:, free_idxs].tocsc()
+
+            self._heat = {'heat': splu(sparse.csc_matrix(mass + h * h * laplacian)),
+                          'poisson': splu(poisson),
+                          'gradient': igl.grad(self.region_vertices, self.region_faces),
+                          'areas': igl.doublearea(self.region_vertices, self.region_faces) / 2,
+                          'free_idxs': free_idxs}
+
+        return self._heat
+
+    def _heat_method(self):
+
+        factors = self._heat_factors()
+        n_faces = len(self.region_faces)
+
+        # 1. diffuse heat from the sources for a short time
+        impulse = np.zeros(len(self.region_vertices))
+        impulse[self.region_source_idxs] = 1
+        heat = factors['heat'].solve(impulse)
+
+        # 2. the normalized gradient points away from the sources
+        gradient = (factors['gradient'] @ heat).reshape(3, n_faces).T
+        norm = np.linalg.norm(gradient, axis=1)
+        norm[norm == 0] = 1
+        field = -gradient / norm[:, np.newaxis]
+
+        # 3. the distance whose gradient fits the field best (area weighted least squares)
+        divergence = factors['gradient'].T @ (field.T.ravel() * np.tile(factors['areas'], 3))
+        distance = np.zeros(len(self.region_vertices))
+        distance[factors['free_idxs']] = factors['poisson'].solve(divergence[factors['free_idxs']])
+
+        return distance
+
+    def distance(self, method='auto'):
+        """
+        :param method: 'exact', 'heat', or 'auto' (exact up to exact_max_faces faces in the region, heat above)
+        :return: geodesic distance of every vertex of the mesh to the sources, inf outside the region and beyond the
+        cutoff
+        """
+
+        if method == 'auto':
+            method = 'exact' if len(self.region_faces) <= exact_max_faces else 'heat'
+
+        distance = np.full(self.n_vertices, np.inf)
+        if len(self.region_source_idxs) == 0:
+            return distance
+
+        if method == 'exact':
+            region_distance = self._exact()
+        elif method == 'heat':
+            region_distance = self._heat_method()
+        else:
+            raise ValueError("unknown geodesic method: " + str(method))
+
+        region_distance = np.where(region_distance <= self.cutoff, region_distance, np.inf)
+        distance[self.region_vertex_idxs] = region_distance
+
+        return distance
+
+    def compare(self, method='heat'):
+        """
+        This function prints the error of an approximate method against the exact solver on the vertices within the
+        cutoff, e.g. to check the heat method on a new resolution
+
+        :param method: the method to check
+        :return: dictionary with the maximum and mean absolute error and the number of vertices that fall on the other
+        side of the cutoff
+        """
+
+        exact = self.distance('exact')
+        approximate = self.distance(method)
+
+        within = np.isfinite(exact) & np.isfinite(approximate)
+        error = np.abs(exact[within] - approximate[within])
+        stats = {'max_error': np.max(error, initial=0),
+                 'mean_error': np.mean(error) if len(error) != 0 else 0.0,
+                 'band_mismatch': int(np.sum(np.isfinite(exact) != np.isfinite(approximate))),
+                 'region_faces': len(self.region_faces)}
+
+        print(method, 'geodesic error, max:', np.round(stats['max_error'], 4), 'mean:', np.round(stats['mean_error'], 4),
+              'vertices on the other side of the cutoff:', stats['band_mismatch'],
+              'region faces:', stats['region_faces'])
+
+        return stats
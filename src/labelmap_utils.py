@@ -0,0 +1,301 @@
+import gzip
+import struct
+import time
+import numpy as np
+import igl
+from concurrent import futures
+from scipy import ndimage, sparse
+from src.cargen_utils import clean
+
+
+# names of the bone surfaces, in the order the rest of the pipeline reads them
+bone_names = ('sacrum', 'lpelvis', 'rpelvis', 'lfemur', 'rfemur')
+
+# NIfTI-1 datatype codes
+nifti_types = {2: 'u1', 4: 'i2', 8: 'i4', 16: 'f4', 64: 'f8', 256: 'i1', 512: 'u2', 768: 'u4', 1024: 'i8', 1280: 'u8'}
+
+
+def _qform_affine(quatern, qoffset, pixdim):
+
+    b, c, d = quatern
+    a = np.sqrt(max(0.0, 1.0 - (b * b + c * c + d * d)))
+    rotation = np.array([[a * a + b * b - c * c - d * d, 2 * (b * c - a * d), 2 * (b * d + a * c)],
+                         [2 * (b * c + a * d), a * a + c * c - b * b - d * d, 2 * (c * d - a * b)],
+                         [2 * (b * d - a * c), 2 * (c * d + a * b), a * a + d * d - c * c - b * b]])
+    qfac = -1.0 if pixdim[0] < 0 else 1.0
+
+    affine = np.eye(4)
+    affine[:3, :3] = rotation * np.array([pixdim[1], pixdim[2], pixdim[3] * qfac])
+    affine[:3, 3] = qoffset
+
+    return affine
+
+
+def read_nifti_header(path):
+    """
+    This function reads the header of a NIfTI-1 file (.nii or .nii.gz)
+
+    :param path: path of the NIfTI file
+    :return: dictionary with the shape, dtype, vox_offset and the voxel to world (mm) affine
+    """
+
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'rb') as fl:
+        header = fl.read(348)
+
+    if len(header) < 348:
+        raise ValueError("not a NIfTI-1 file: " + str(path))
+
+    endian = '<'
+    if struct.unpack('<i', header[:4])[0] != 348:
+        endian = '>'
+        if struct.unpack('>i', header[:4])[0] != 348:
+            raise ValueError("not a NIfTI-1 file (NIfTI-2 is not supported): " + str(path))
+
+    if header[344:347] not in (b'n+1', b'ni1'):
+        raise ValueError("not a NIfTI-1 file: " + str(path))
+    if header[344:347] == b'ni1':
+        raise ValueError("split .hdr/.img files are not supported: " + str(path))
+
+    dim = struct.unpack(endian + '8h', header[40:56])
+    datatype = struct.unpack(endian + 'h', header[70:72])[0]
+    pixdim = struct.unpack(endian + '8f', header[76:108])
+    vox_offset = int(struct.unpack(endian + 'f', header[108:112])[0])
+    qform_code, sform_code = struct.unpack(endian + '2h', header[252:256])
+    quatern = struct.unpack(endian + '3f', header[256:268])
+    qoffset = struct.unpack(endian + '3f', header[268:280])
+    srow = struct.unpack(endian + '12f', header[280:328])
+
+    if datatype not in nifti_types:
+        raise ValueError("unsupported NIfTI datatype " + str(datatype) + ": " + str(path))
+
+    shape = tuple(dim[1:dim[0] + 1])
+    while len(shape) > 3 and shape[-1] == 1:
+        shape = shape[:-1]
+    if len(shape) != 3:
+        raise ValueError("expected a 3D label map, got shape " + str(shape) + ": " + str(path))
+
+    if sform_code > 0:
+        affine = np.eye(4)
+        affine[:3] = np.array(srow).reshape(3, 4)
+    elif qform_code > 0:
+        affine = _qform_affine(quatern, qoffset, pixdim)
+    else:
+        affine = np.diag([pixdim[1], pixdim[2], pixdim[3], 1.0])
+
+    return {'shape': shape,
+            'dtype': np.dtype(endian + nifti_types[datatype]),
+            'vox_offset': max(vox_offset, 352),
+            'affine': affine}
+
+
+def read_nifti(path, mmap=True):
+    """
+    This function reads the voxels of a NIfTI-1 label map. Uncompressed files are memory-mapped, so only the slices
+    that are used are read from disk. The stored values are returned as they are (no scl_slope scaling), which is what
+    a label map needs.
+
+    :param path: path of the NIfTI file
+    :param mmap: memory-map the voxels (only for uncompressed .nii files)
+    :return: voxel array indexed [i, j, k] and the voxel to world (mm) affine
+    """
+
+    header = read_nifti_header(path)
+
+    if mmap and not str(path).endswith('.gz'):
+        voxels = np.memmap(path, dtype=header['dtype'], mode='r', offset=header['vox_offset'],
+                           shape=header['shape'], order='F')
+    else:
+        opener = gzip.open if str(path).endswith('.gz') else open
+        with opener(path, 'rb') as fl:
+            fl.seek(header['vox_offset'])
+            count = int(np.prod(header['shape']))
+            buffer = fl.read(count * header['dtype'].itemsize)
+        voxels = np.frombuffer(buffer, dtype=header['dtype'], count=count).reshape(header['shape'], order='F')
+
+    return voxels, header['affine']
+
+
+def list_labels(path):
+    """
+    This function prints the labels of a label map with their voxel count and bounding box, e.g. to find out which
+    label belongs to which bone
+
+    :param path: path of the NIfTI label map
+    :return: dictionary of label to voxel count
+    """
+
+    voxels, _ = read_nifti(path)
+    values, counts = np.unique(np.asarray(voxels), return_counts=True)
+    boxes = label_bounding_boxes(voxels, [v for v in values if v > 0])
+
+    for value, count in zip(values, counts):
+        if value > 0:
+            print('label:', value, 'voxels:', count, 'bounding box:', boxes[value])
+
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def label_bounding_boxes(voxels, labels):
+    """
+    This function finds the bounding box of each label in a single pass over the label map
+
+    :param voxels: label map
+    :param labels: list of labels (positive integers)
+    :return: dictionary of label to ((i0, i1), (j0, j1), (k0, k1)), None for labels that do not occur
+    """
+
+    slices = ndimage.find_objects(np.asarray(voxels).astype(np.int32, copy=False), max_label=int(max(labels)))
+
+    boxes = {}
+    for label in labels:
+        box = slices[int(label) - 1]
+        boxes[label] = None if box is None else tuple((s.start, s.stop) for s in box)
+
+    return boxes
+
+
+def taubin_smooth(vertices, faces, iterations, lambda_factor=0.5, mu_factor=-0.53):
+    """
+    This function smooths a surface with Taubin's lambda/mu scheme on the uniform Laplacian. Unlike plain Laplacian
+    smoothing it removes the staircase of the voxels without shrinking the bone.
+
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    :param iterations: number of lambda/mu step pairs
+    :param lambda_factor: positive (smoothing) step
+    :param mu_factor: negative (inflating) step
+    :return: smoothed vertex positions
+    """
+
+    adjacency = igl.adjacency_matrix(faces).astype(np.float64)
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    degree[degree == 0] = 1
+    average = sparse.diags(1 / degree) @ adjacency
+
+    vertices = vertices.copy()
+    for _ in range(iterations):
+        vertices += lambda_factor * (average @ vertices - vertices)
+        vertices += mu_factor * (average @ vertices - vertices)
+
+    return vertices
+
+
+def _orient_outward(vertices, faces):
+
+    # marching cubes and a mirrored affine can both flip the winding, make the winding consistent within each connected
+    # component and flip every component that does not enclose a positive volume
+    faces, components = igl.bfs_orient(faces)
+    faces = np.asarray(faces)
+    components = np.asarray(components).ravel()
+
+    v0, v1, v2 = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    volumes = np.bincount(components, weights=np.einsum('ij,ij->i', v0, np.cross(v1, v2)))
+    flip = volumes[components] < 0
+    faces[flip] = faces[flip][:, ::-1]
+
+    return np.ascontiguousarray(faces)
+
+
+def extract_label_surface(path, label, box, sigma=1.0, smoothing_iteration=10, target_faces=None, lps=False):
+    """
+    This function extracts the surface of one label of a label map. Only the bounding box of the label is read, the
+    mask is blurred with a gaussian to remove the voxel staircase and the surface is extracted at the 0.5 level with
+    marching cubes. The result is smoothed, decimated, cleaned and only the largest component is kept.
+
+    :param path: path of the NIfTI label map
+    :param label: the label value of the bone
+    :param box: bounding box of the label, see label_bounding_boxes
+    :param sigma: standard deviation (in voxels) of the gaussian applied to the mask, 0 turns it off
+    :param smoothing_iteration: number of Taubin smoothing steps, 0 turns it off
+    :param target_faces: the number of faces to decimate to, None keeps the marching cubes resolution
+    :param lps: return the coordinates in LPS (3D Slicer's default for exported models) instead of RAS
+    :return: vertices (mm) and faces of the bone surface
+    """
+
+    voxels, affine = read_nifti(path)
+    pad = 2 + int(np.ceil(3 * sigma))
+    lower = [max(b[0] - pad, 0) for b in box]
+    upper = [min(b[1] + pad, n) for b, n in zip(box, voxels.shape)]
+
+    crop = np.asarray(voxels[lower[0]:upper[0], lower[1]:upper[1], lower[2]:upper[2]]) == label
+    # a zero border closes the surface where the bone touches the image boundary
+    mask = np.pad(crop.astype(np.float64), 1)
+    if sigma > 0:
+        mask = ndimage.gaussian_filter(mask, sigma)
+
+    nx, ny, nz = mask.shape
+    grid = np.stack(np.meshgrid(np.arange(nx), np.arange(ny), np.arange(nz), indexing='ij'), axis=-1)
+    grid = grid.reshape(-1, 3, order='F') + (np.array(lower) - 1)
+
+    vertices, faces = igl.marching_cubes(mask.ravel(order='F'), grid.astype(np.float64), nx, ny, nz, 0.5)
+
+    vertices = vertices @ affine[:3, :3].T + affine[:3, 3]
+    if lps:
+        vertices[:, :2] *= -1
+
+    vertices, faces = clean(vertices, faces.astype(np.int64))
+
+    components = igl.face_components(faces)
+    faces = faces[components == np.argmax(np.bincount(components))]
+    vertices, faces, _, _ = igl.remove_unreferenced(vertices, faces)
+
+    if smoothing_iteration > 0:
+        vertices = taubin_smooth(vertices, faces, smoothing_iteration)
+
+    if target_faces is not None and target_faces < len(faces):
+        _, vertices, faces, _, _ = igl.decimate(vertices, faces, int(target_faces))
+        vertices, faces = clean(vertices, faces)
+
+    faces = _orient_outward(vertices, faces)
+
+    return vertices, faces
+
+
+def _timed_extract(name, path, label, box, kwargs):
+
+    start = time.perf_counter()
+    vertices, faces = extract_label_surface(path, label, box, **kwargs)
+
+    return name, vertices, faces, time.perf_counter() - start
+
+
+def extract_bone_surfaces(path, labels, max_workers=None, sigma=1.0, smoothing_iteration=10, target_faces=None,
+                          lps=False):
+    """
+    This function extracts the bone surfaces of a label map, each bone in its own worker process. The label map is
+    scanned once for the bounding boxes, after that every worker only reads the box of its own bone. The result can go
+    straight into remesh, like the output of read_and_clean.
+
+    :param path: path of the NIfTI label map, e.g. model_repository/LabelMaps/m1-labelmap.nii
+    :param labels: dictionary of bone name to label value, e.g. {'sacrum': ..., 'lpelvis': ..., ...}. The label
+    values differ between label maps, use list_labels to look them up.
+    :param max_workers: number of worker processes, None uses one per bone (at most the number of cpus)
+    :param sigma: see extract_label_surface
+    :param smoothing_iteration: see extract_label_surface
+    :param target_faces: see extract_label_surface, a single number or a dictionary of bone name to number of faces
+    :param lps: see extract_label_surface
+    :return: dictionary of bone name to (vertices, faces)
+    """
+
+    voxels, _ = read_nifti(path)
+    boxes = label_bounding_boxes(voxels, list(labels.values()))
+    del voxels
+
+    for name, label in labels.items():
+        if boxes[label] is None:
+            raise ValueError("label " + str(label) + " (" + name + ") does not occur in " + str(path))
+
+    jobs = []
+    for name, label in labels.items():
+        faces = target_faces.get(name) if isinstance(target_faces, dict) else target_faces
+        kwargs = {'sigma': sigma, 'smoothing_iteration': smoothing_iteration, 'target_faces': faces, 'lps': lps}
+        jobs.append((name, str(path), label, boxes[label], kwargs))
+
+    surfaces = {}
+    with futures.ProcessPoolExecutor(max_workers=max_workers or len(jobs)) as executor:
+        for name, vertices, faces, seconds in executor.map(_timed_extract, *zip(*jobs)):
+            print(name, 'number of faces:', len(faces), '(%.2f s)' % seconds)
+            surfaces[name] = (vertices, faces)
+
+    return surfaces
@@ -0,0 +1,137 @@
+import numpy as np
+import igl
+
+
+def face_areas(vertices, faces):
+    """
+    This function measures the area of every triangle of a surface mesh
+
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    :return: area of each triangle
+    """
+
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+
+    u = vertices[faces[:, 1]] - vertices[faces[:, 0]]
+    v = vertices[faces[:, 2]] - vertices[faces[:, 0]]
+
+    return np.linalg.norm(np.cross(u, v), axis=1) / 2
+
+
+def region_areas(vertices, faces, regions):
+    """
+    This function measures the area of several face subsets of one surface mesh, the triangle areas are computed once
+    for all of them
+
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    :param regions: list of facet index lists, e.g. [p_face_idxs, s_face_idxs]
+    :return: area of each region
+    """
+
+    areas = face_areas(vertices, faces)
+
+    return np.array([np.sum(areas[np.asarray(face_idxs, dtype=np.int64)]) for face_idxs in regions])
+
+
+def vertex_areas(vertices, faces):
+    """
+    This function measures the area around every vertex, a third of the area of each triangle goes to each of its
+    corners (barycentric area)
+
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    :return: area of each vertex, zero for unreferenced vertices
+    """
+
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    areas = face_areas(vertices, faces)
+
+    return np.bincount(faces.ravel(), weights=np.repeat(areas / 3, 3), minlength=len(vertices))
+
+
+def weighted_percentile(values, weights, percentiles):
+    """
+    :param values: list of values
+    :param weights: weight of each value, e.g. its area
+    :param percentiles: list of percentiles between 0 and 100
+    :return: the weighted percentiles, linearly interpolated between the values
+    """
+
+    order = np.argsort(values)
+    values = np.asarray(values, dtype=np.float64)[order]
+    weights = np.asarray(weights, dtype=np.float64)[order]
+
+    # each value sits in the middle of its own weight
+    positions = (np.cumsum(weights) - weights / 2) / np.sum(weights)
+
+    return np.interp(np.asarray(percentiles, dtype=np.float64) / 100, positions, values)
+
+
+def thickness_stats(vertices, faces, thickness, face_idxs=None, per_face=False, percentiles=(5, 50, 95)):
+    """
+    This function computes area-weighted statistics of a thickness map on a region of a surface mesh, e.g. the
+    harmonic thickness on the base of a cartilage
+
+    :param vertices: list of vertex positions
+    :param faces: list of triangle indices
+    :param thickness: thickness of each vertex (or of each face when per_face is set)
+    :param face_idxs: list of facet indices of the region, None takes the whole mesh
+    :param per_face: the thickness is given per face instead of per vertex
+    :param percentiles: list of percentiles between 0 and 100
+    :return: dictionary with the area, the weighted mean, min, max and the percentiles of the region
+    """
+
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    thickness = np.asarray(thickness, dtype=np.float64)
+
+    if face_idxs is None:
+        face_idxs = np.arange(len(faces))
+    face_idxs = np.asarray(face_idxs, dtype=np.int64)
+
+    if per_face:
+        values = thickness[face_idxs]
+        weights = face_areas(vertices, faces[face_idxs])
+    else:
+        weights = vertex_areas(vertices, faces[face_idxs])
+        vertex_idxs = np.flatnonzero(weights)
+        values = thickness[vertex_idxs]
+        weights = weights[vertex_idxs]
+
+    stats = {'area': np.sum(weights),
+             'mean': np.sum(values * weights) / np.sum(weights),
+             'min': np.min(values),
+             'max': np.max(values)}
+
+    for percentile, value in zip(percentiles, weighted_percentile(values, weights, percentiles)):
+        stats['p' + str(percentile)] = value
+
+    return stats
+
+
+def contact_area(vertices_1, faces_1, vertices_2, faces_2, epsilon):
+    """
+    This function measures the part of the first surface that lies within epsilon of the second one, e.g. the contact
+    in a cartilage-cartilage interface
+
+    :param vertices_1: list of vertex positions of the first surface
+    :param faces_1: list of triangle indices of the first surface
+    :param vertices_2: list of vertex positions of the second surface
+    :param faces_2: list of triangle indices of the second surface
+    :param epsilon: distance threshold, triangles whose centroid is closer are in contact
+    :return: the contact area, the facet indices in contact and the minimum signed distance
+    """
+
+    # triangle centroids
+    triangle_centroids = igl.barycenter(vertices_1, faces_1)
+
+    # point to surface distance
+    sd_value, _, _ = igl.signed_distance(triangle_centroids, vertices_2, faces_2, return_normals=False)
+
+    # faces below a distance threshold
+    contact_face_idxs = np.where(sd_value <= epsilon)[0]
+    area = np.sum(face_areas(vertices_1, faces_1)[contact_face_idxs])
+
+    return area, contact_face_idxs, np.min(sd_value)
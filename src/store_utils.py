@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from src.writer_utils import atomic_write
+
+
+manifest_name = 'manifest.json'
+
+_manifest_lock = threading.Lock()
+
+# manifest path -> ((modification time, size) of the file, manifest), so a store's manifest is parsed once
+_manifests = {}
+
+
+def _split_data_path(data_path):
+    """
+    This function splits a data path into the store directory and the dataset name
+
+    :param data_path: path of the array with or without the '.npy' suffix, e.g. nodal_output/m1/m1_wog_legL_femur_faces
+    :return: store directory and dataset name
+    """
+
+    data_path = Path(str(data_path))
+    if data_path.suffix == '.npy':
+        data_path = data_path.with_suffix('')
+
+    return data_path.parent, data_path.name
+
+
+def read_manifest(store_dir):
+    """
+    This function reads the manifest of a store directory. It is parsed once and again only after the file changed.
+
+    :param store_dir: per-subject directory that holds the arrays
+    :return: dictionary of dataset name to file, dtype and shape
+    """
+
+    return dict(_cached_manifest(store_dir))
+
+
+def _cached_manifest(store_dir):
+
+    # the manifest is parsed again only when the file changed since it was last read
+    manifest_path = Path(str(store_dir)) / manifest_name
+
+    try:
+        stat = os.stat(manifest_path)
+    except FileNotFoundError:
+        return {}
+
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _manifests.get(manifest_path)
+    if cached is None or cached[0] != version:
+        with open(manifest_path, 'r') as manifest_file:
+            cached = (version, json.load(manifest_file))
+        _manifests[manifest_path] = cached
+
+    return cached[1]
+
+
+def _dump_manifest(path, manifest):
+
+    with open(path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+def _write_manifest(store_dir, manifest):
+
+    manifest_path = Path(str(store_dir)) / manifest_name
+    atomic_write(_dump_manifest, manifest_path, manifest)
+    stat = os.stat(manifest_path)
+    _manifests[manifest_path] = ((stat.st_mtime_ns, stat.st_size), dict(manifest))
+
+
+def save_array(data_path, array):
+    """
+    This function saves an intermediate array as a raw (non-pickled) .npy file and records its dtype and shape in the
+    manifest of the same directory. The file name is the same as the one np.save would give, so older readers still
+    work.
+
+    :param data_path: path of the array without the '.npy' suffix
+    :param array: numeric array, lists are converted first
+    :return: path of the written file
+    """
+
+    array = np.asarray(array)
+
+    if array.dtype == object:
+        raise ValueError("object arrays need pickling and can not be stored: " + str(data_path))
+
+    store_dir, name = _split_data_path(data_path)
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    file_path = store_dir / (name + '.npy')
+    atomic_write(np.save, file_path, np.ascontiguousarray(array), allow_pickle=False)
+
+    with _manifest_lock:
+        manifest = read_manifest(store_dir)
+        manifest[name] = {'file': file_path.name, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        _write_manifest(store_dir, manifest)
+
+    return file_path
+
+
+def load_array(data_path, mmap_mode='r'):
+    """
+    This function opens an intermediate array without pickling. By default the array is memory-mapped read-only, so
+    only the slices that are used are read from disk.
+
+    :param data_path: path of the array with or without the '.npy' suffix
+    :param mmap_mode: mode passed to np.load, None reads the whole array into memory
+    :return: the array
+    """
+
+    store_dir, name = _split_data_path(data_path)
+    file_path = store_dir / (name + '.npy')
+
+    array = np.load(file_path, mmap_mode=mmap_mode, allow_pickle=False)
+
+    entry = _cached_manifest(store_dir).get(name)
+    if entry is not None and (entry['dtype'] != array.dtype.str or tuple(entry['shape']) != array.shape):
+        raise ValueError("array does not match the manifest: " + str(file_path))
+
+    return array
+
+
+def update_manifest(store_dir):
+    """
+    This function adds every .npy file of a store directory to its manifest, e.g. for arrays written before the
+    manifest existed. Files that need pickling are skipped and reported.
+
+    :param store_dir: per-subject directory that holds the arrays
+    :return: the manifest
+    """
+
+    store_dir = Path(str(store_dir))
+    manifest = read_manifest(store_dir)
+
+    for file_path in sorted(store_dir.glob('*.npy')):
+        try:
+            array = np.load(file_path, mmap_mode='r', allow_pickle=False)
+        except ValueError:
+            print('skipped pickled array:', file_path.name)
+            continue
+        manifest[file_path.stem] = {'file': file_path.name, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    _write_manifest(store_dir, manifest)
+
+    return manifest
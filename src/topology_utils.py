@@ -0,0 +1,210 @@
+from collections import OrderedDict
+import numpy as np
+import igl
+from src.faceset_utils import FaceSetMorphology
+
+
+def _read_only(arrays):
+
+    # cached results are shared by all callers, changing one in place would change it for everyone
+    for array in arrays if isinstance(arrays, tuple) else (arrays,):
+        array.setflags(write=False)
+
+    return arrays
+
+
+class MeshTopology:
+    """
+    The connectivity of a triangle mesh, computed on first use and kept: the vertex to face adjacency (VF), the
+    triangle to triangle adjacency (TT), the edge maps, the face-set morphology, and the boundary edges/loops of face
+    subsets. The subsets are remembered by their face indices, so asking for the boundary of the same subset twice costs
+    nothing.
+
+    topology = src.MeshTopology(p_vertices, p_faces)
+    face_adjacency, cumulative_sum = topology.vertex_faces
+    s2_face_idxs = topology.vertex_star(s2_vertex_idxs)
+    trim_p_face_idxs = src.trim_boundary(p_faces, p_face_idxs, face_adjacency, cumulative_sum, 2,
+                                         morphology=topology.morphology)
+    """
+
+    def __init__(self, vertices, faces, max_subsets=32):
+        self.faces = np.asarray(faces)
+        self.n_vertices = len(vertices)
+        self.max_subsets = max_subsets
+        self._cache = {}
+        self._subsets = OrderedDict()
+
+    def _memo(self, name, compute):
+        if name not in self._cache:
+            self._cache[name] = _read_only(compute())
+        return self._cache[name]
+
+    @property
+    def vertex_faces(self):
+        """
+        face_adjacency, cumulative_sum as igl.vertex_triangle_adjacency returns them: the faces of vertex j are
+        face_adjacency[cumulative_sum[j]:cumulative_sum[j + 1]]
+        """
+        return self._memo('vertex_faces', lambda: igl.vertex_triangle_adjacency(self.faces, self.n_vertices))
+
+    @property
+    def triangle_adjacency(self):
+        """
+        TT, TTi as igl.triangle_triangle_adjacency returns them, -1 marks a boundary edge
+        """
+        return self._memo('triangle_adjacency', lambda: igl.triangle_triangle_adjacency(self.faces))
+
+    @property
+    def edges(self):
+        """
+        E, EMAP, EF, EI as igl.edge_flaps returns them: the unique edges, the edge of each face corner and the faces
+        on both sides of each edge
+        """
+        return self._memo('edges', lambda: igl.edge_flaps(self.faces))
+
+    @property
+    def morphology(self):
+        """
+        the FaceSetMorphology of the mesh, built on the vertex to face adjacency, for trimming, growing and gap filling
+        """
+        if 'morphology' not in self._cache:
+            self._cache['morphology'] = FaceSetMorphology(self.faces, *self.vertex_faces)
+        return self._cache['morphology']
+
+    def _star_positions(self, vertex_idxs):
+        face_adjacency, cumulative_sum = self.vertex_faces
+        vertex_idxs = np.asarray(vertex_idxs, dtype=np.int64).ravel()
+        starts = cumulative_sum[vertex_idxs]
+        lengths = cumulative_sum[vertex_idxs + 1] - starts
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return positions, lengths
+
+    def vertex_star(self, vertex_idxs):
+        """
+        the faces around the given vertices, vertex after vertex in the order of vertex_idxs (a face shared by two of
+        the vertices appears twice), i.e. the result of
+
+        for j in vertex_idxs:
+            for k in range(cumulative_sum[j], cumulative_sum[j + 1]):
+                face_idxs += [face_adjacency[k]]
+        """
+        positions, _ = self._star_positions(vertex_idxs)
+        return self.vertex_faces[0][positions]
+
+    def vertex_stars(self, vertex_idxs):
+        """
+        the faces around each of the given vertices, one array per vertex
+        """
+        positions, lengths = self._star_positions(vertex_idxs)
+        if len(lengths) == 0:
+            return []
+        return np.split(self.vertex_faces[0][positions], np.cumsum(lengths)[:-1])
+
+    def _subset(self, face_idxs):
+        face_idxs = np.asarray(face_idxs, dtype=np.int64)
+        key = face_idxs.tobytes()
+        subset = self._subsets.get(key)
+        if subset is None:
+            subset = {}
+            self._subsets[key] = subset
+            while len(self._subsets) > self.max_subsets:
+                self._subsets.popitem(last=False)
+        else:
+            self._subsets.move_to_end(key)
+        return face_idxs, subset
+
+    def boundary_edges(self, face_idxs):
+        """
+        the boundary edges of a face subset, as igl.boundary_facets(faces[face_idxs])
+        """
+        face_idxs, subset = self._subset(face_idxs)
+        if 'edges' not in subset:
+            subset['edges'] = _read_only(igl.boundary_facets(self.faces[face_idxs]))
+        return subset['edges']
+
+    def boundary_vertices(self, face_idxs):
+        """
+        the sorted vertex indices on the boundary of a face subset
+        """
+        face_idxs, subset = self._subset(face_idxs)
+        if 'vertices' not in subset:
+            subset['vertices'] = _read_only(np.unique(self.boundary_edges(face_idxs).flatten()))
+        return subset['vertices']
+
+    def boundary_loop(self, face_idxs):
+        """
+        the longest boundary loop of a face subset, as igl.boundary_loop(faces[face_idxs])
+        """
+        face_idxs, subset = self._subset(face_idxs)
+        if 'loop' not in subset:
+            subset['loop'] = _read_only(igl.boundary_loop(self.faces[face_idxs]))
+        return subset['loop']
+
+
+def _triangle_keys(triangles, n_vertices):
+
+    # the vertex triple in ascending order is the same for every orientation of a triangle
+    triangles = np.sort(np.asarray(triangles, dtype=np.int64).reshape(-1, 3), axis=1)
+
+    # one integer per triangle while it fits, the fields of the triple otherwise (same order, but slower to sort)
+    if n_vertices ** 3 < np.iinfo(np.int64).max:
+        return (triangles[:, 0] * n_vertices + triangles[:, 1]) * n_vertices + triangles[:, 2]
+
+    return np.ascontiguousarray(triangles).view([('a', np.int64), ('b', np.int64), ('c', np.int64)]).ravel()
+
+
+class TriangleIndex:
+    """
+    A lookup table of triangles by their vertex indices, regardless of their orientation. The rows are sorted once,
+    after that "which rows of the table are these triangles" is answered for all query triangles together with one
+    binary search.
+
+    index = src.TriangleIndex(flipped_all_tri)
+    femur_tri_idxs = index.find(flipped_femur_tri)
+    """
+
+    def __init__(self, triangles):
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self.n_triangles = len(triangles)
+        self.n_vertices = int(triangles.max()) + 1 if self.n_triangles else 1
+
+        keys = _triangle_keys(triangles, self.n_vertices)
+        # stable, so of repeated triangles the first row is found
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def lookup(self, triangles):
+        """
+        :param triangles: list of triangles (vertex indices)
+        :return: for each triangle the row of the table that holds it, -1 if it is not in the table
+        """
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        rows = np.full(len(triangles), -1, dtype=np.int64)
+        if self.n_triangles == 0 or len(triangles) == 0:
+            return rows
+
+        # vertex indices beyond the table can not match
+        valid = np.all(triangles < self.n_vertices, axis=1)
+        keys = _triangle_keys(triangles[valid], self.n_vertices)
+
+        positions = np.minimum(np.searchsorted(self.sorted_keys, keys), self.n_triangles - 1)
+        found = self.sorted_keys[positions] == keys
+        rows[np.flatnonzero(valid)[found]] = self.order[positions[found]]
+
+        return rows
+
+    def find(self, triangles):
+        """
+        :param triangles: list of triangles (vertex indices)
+        :return: the rows of the table that hold the triangles, in the order of the triangles, missing ones left out
+        """
+        rows = self.lookup(triangles)
+        return rows[rows >= 0]
+
+    def contains(self, triangles):
+        """
+        :param triangles: list of triangles (vertex indices)
+        :return: boolean array, True for the triangles that are in the table
+        """
+        return self.lookup(triangles) >= 0
@@ -1,5 +1,6 @@
 import json
 import os
+import time
 import meshio
 import numpy as np
 import src
@@ -63,13 +64,15 @@ def mk_json(name, operation, json_dir):
     return json_path
 
 
-def run_boolean(ftetwild_dir, json_path, output_path, epsilon, edge_length):
+def run_boolean(ftetwild_dir, json_path, output_path, epsilon, edge_length, binary=False):
     """
     :param ftetwild_dir: locate this path to the 'build' folder of ftetwild.
     :param json_path:
     :param output_path:
     :param epsilon:
     :param edge_length:
+    :param binary: if True, ftetwild writes the raw tetrahedralization (output_path + "__all.msh") as binary gmsh,
+                   which read_volume_mesh reads without parsing text.
 
     """
 
@@ -78,14 +81,68 @@ def run_boolean(ftetwild_dir, json_path, output_path, epsilon, edge_length):
 
     prev_path = Path.cwd()
 
+    binary_flag = "" if binary else " --no-binary"
+
     os.chdir(ftetwild_dir)
     os.system("./FloatTetwild_bin --csg " + json_path +
               " --level 3 -e " + epsilon + " -l " + edge_length +
-              " -o " + output_path + " --no-binary --no-color --export-raw")
+              " -o " + output_path + binary_flag + " --no-color --export-raw")
 
     os.chdir(prev_path)
 #--stop-energy 8
 
+
+def benchmark_boolean_output(ftetwild_dir, json_path, output_path, epsilon, edge_length):
+    """
+    This function runs the same boolean operation with ascii and with binary output and prints, for each, the time
+    spent in ftetwild, the time to read the raw tetrahedralization back and the size of the raw file. It also checks
+    that both raw files read back to meshes of the same size and extent, so the binary path can be trusted downstream.
+
+    :param ftetwild_dir: locate this path to the 'build' folder of ftetwild.
+    :param json_path:
+    :param output_path: the format name is appended to keep both outputs
+    :param epsilon:
+    :param edge_length:
+    :return: dictionary of (boolean time, read time, file size) per output
+    """
+
+    results = {}
+    meshes = {}
+
+    for binary in (False, True):
+        name = "binary" if binary else "ascii"
+        path = output_path + '_' + name
+
+        start = time.perf_counter()
+        run_boolean(ftetwild_dir, json_path, path, epsilon, edge_length, binary=binary)
+        boolean_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vertices, elements = read_volume_mesh(path + "__all.msh", None, None)
+        read_time = time.perf_counter() - start
+
+        results[name] = (boolean_time, read_time, os.path.getsize(path + "__all.msh"))
+        meshes[name] = (vertices, elements)
+
+        print(name,
+              'boolean: %.2f s' % boolean_time,
+              'read: %.2f s' % read_time,
+              'size: %.1f MB' % (results[name][2] / 1e6),
+              'raw elements:', len(elements))
+
+    # ftetwild is not bit-reproducible between runs, so the two outputs are compared by size and extent
+    (a_vertices, a_elements), (b_vertices, b_elements) = meshes["ascii"], meshes["binary"]
+    if (b_elements.min() < 0 or b_elements.max() >= len(b_vertices) or
+            not np.allclose([a_vertices.min(axis=0), a_vertices.max(axis=0)],
+                            [b_vertices.min(axis=0), b_vertices.max(axis=0)], atol=1e-6)):
+        raise ValueError("the binary raw output does not read back like the ascii one: " + output_path)
+
+    print('vertices ascii/binary:', len(a_vertices), len(b_vertices),
+          'elements ascii/binary:', len(a_elements), len(b_elements))
+
+    return results
+
+
 def viz(vertices, elements, tet_physical):
     """
 
@@ -150,16 +207,33 @@ def make_cut_plane_view(v, f, d=0, s=0.5):
 
     return idx
 
-def read_volume_mesh(path, input_dimension, output_dimension):
+def read_volume_mesh(path, input_dimension, output_dimension, return_labels=False):
     """
-
-    :param path:
-    :return:
+    This function reads a labeled tetrahedral mesh written by leg_filter / girdle_filter. The format is picked from
+    the file suffix: '.npz' is read as the compressed numpy container, anything else goes through meshio, which
+    detects ASCII/binary gmsh 2.2 and 4.1 on its own.
+
+    :param path: path to the volume mesh
+    :param input_dimension: dimension of the stored mesh
+    :param output_dimension: if "m", the vertices are divided by 1000
+    :param return_labels: if True, the physical tag of each element is returned as well
+    :return: vertices, elements (and labels)
     """
 
-    mesh = meshio.read(path, file_format="gmsh")
-    vertices = mesh.points
-    elements = mesh.get_cells_type("tetra")
+    path = str(path)
+
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            vertices = data["points"]
+            elements = data["tetra"]
+            labels = data["gmsh:physical"]
+    else:
+        mesh = meshio.read(path, file_format="gmsh")
+        vertices = mesh.points
+        elements = mesh.get_cells_type("tetra")
+        labels = None
+        if return_labels and "gmsh:physical" in mesh.cell_data_dict:
+            labels = mesh.cell_data_dict["gmsh:physical"]["tetra"]
 
     if output_dimension == "m":
         vertices = vertices / 1000
@@ -171,9 +245,95 @@ def read_volume_mesh(path, input_dimension, output_dimension):
 
     # print("the model has this many parts:", domains)
 
+    if return_labels:
+        return vertices, elements, labels
+
     return vertices, elements
 
-def leg_filter (csg_output_dir, output_path, data_path,  vertices_c, faces_c, vertices_f, faces_f, input_dimension, output_dimension):
+
+def write_volume_mesh(path, vertices, elements, labels, volume_format="gmsh22_binary"):
+    """
+    This function writes a labeled tetrahedral mesh and keeps the physical/geometrical tags.
+
+    :param path: output path without suffix
+    :param vertices: list of vertex positions
+    :param elements: list of tetrahedral elements
+    :param labels: physical tag of each element
+    :param volume_format: "gmsh22_binary" (default), "gmsh22" (ascii) or "npz" (compressed numpy container)
+    :return: the path of the written file
+    """
+
+    labels = np.asarray(labels)
+
+    if volume_format in ("gmsh22", "gmsh22_binary"):
+        # gmsh 2.2 keeps the vertex numbering, which the saved nodal face indices rely on
+        out_path = path + '.msh'
+        src.atomic_write(
+            meshio.write_points_cells,
+            out_path,
+            points=vertices,
+            cells=[("tetra", elements)],
+            cell_data={"gmsh:physical": np.array([labels]), "gmsh:geometrical": np.array([labels])},
+            file_format="gmsh22",
+            binary=(volume_format == "gmsh22_binary"),
+        )
+
+    elif volume_format == "npz":
+        out_path = path + '.npz'
+        src.atomic_write(np.savez_compressed, out_path,
+                         points=vertices,
+                         tetra=elements,
+                         **{"gmsh:physical": labels, "gmsh:geometrical": labels})
+
+    else:
+        raise ValueError("unknown volume format: " + str(volume_format))
+
+    return out_path
+
+
+def benchmark_volume_formats(vertices, elements, labels, output_path, volume_formats=("gmsh22", "gmsh22_binary", "npz")):
+    """
+    This function writes and reads back the same labeled mesh in each format and prints the timing and file size
+    relative to the ascii gmsh 2.2 path.
+
+    :param vertices: list of vertex positions
+    :param elements: list of tetrahedral elements
+    :param labels: physical tag of each element
+    :param output_path: output path without suffix, the format name is appended
+    :param volume_formats: formats to compare
+    :return: dictionary of (write time, read time, file size) per format
+    """
+
+    results = {}
+
+    for volume_format in volume_formats:
+        start = time.perf_counter()
+        out_path = write_volume_mesh(output_path + '_' + volume_format, vertices, elements, labels, volume_format)
+        write_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        r_vertices, r_elements, r_labels = read_volume_mesh(out_path, None, None, return_labels=True)
+        read_time = time.perf_counter() - start
+
+        if not (np.array_equal(r_elements, elements) and np.array_equal(r_labels, labels)
+                and np.allclose(r_vertices, vertices)):
+            raise ValueError("the " + volume_format + " mesh does not read back as it was written: " + out_path)
+
+        results[volume_format] = (write_time, read_time, os.path.getsize(out_path))
+
+    ref = results.get("gmsh22", next(iter(results.values())))
+
+    for volume_format, (write_time, read_time, size) in results.items():
+        print(volume_format,
+              'write: %.3f s (x%.1f)' % (write_time, ref[0] / write_time),
+              'read: %.3f s (x%.1f)' % (read_time, ref[1] / read_time),
+              'size: %.1f MB (x%.1f)' % (size / 1e6, ref[2] / size))
+
+    return results
+
+
+def leg_filter (csg_output_dir, output_path, data_path,  vertices_c, faces_c, vertices_f, faces_f, input_dimension, output_dimension,
+                volume_format="gmsh22_binary", writer=None):
 
     raw_vertices, raw_elements = read_volume_mesh(csg_output_dir + "__all.msh", input_dimension, output_dimension)
 
@@ -218,6 +378,9 @@ def leg_filter (csg_output_dir, output_path, data_path,  vertices_c, faces_c, ve
     flipped_all_tri = np.copy(all_tri)
     flipped_all_tri[:, [0, 1]] = flipped_all_tri[:, [1, 0]]
 
+    # lookup table of the model surface, to find the triangles of each part in it
+    all_tri_index = src.TriangleIndex(flipped_all_tri)
+
     # femur surface
     femur_tri = igl.boundary_facets(physical_elements[len(elemC_idxs):])
 
@@ -225,23 +388,16 @@ def leg_filter (csg_output_dir, output_path, data_path,  vertices_c, faces_c, ve
     flipped_femur_tri = np.copy(femur_tri)
     flipped_femur_tri[:, [0, 1]] = flipped_femur_tri[:, [1, 0]]
 
-    np.save(data_path + '_femur_faces', flipped_femur_tri )
-
-    femur_tri_idxs = []
+    src.submit_or_write(writer, src.save_array, data_path + '_femur_faces', flipped_femur_tri)
 
-    for i in range(len(flipped_femur_tri)):
-        ind = np.where(flipped_all_tri == flipped_femur_tri[i])[0]
-        m = np.unique(ind, return_counts=True)[1]
-        o = np.where(m == 3)[0]
-        if len(o) != 0:
-            femur_tri_idxs.append(ind[o[0]])
+    femur_tri_idxs = all_tri_index.find(flipped_femur_tri)
 
     slide_tri_idxs = np.delete(all_tri_idxs, femur_tri_idxs, axis=0)
 
     frame = mp.plot(physical_vertices, flipped_all_tri[slide_tri_idxs], c=src.pastel_blue, shading=src.sh_true)
     slide_surface_list = flipped_all_tri[slide_tri_idxs]
 
-    np.save( data_path+'_sliding_faces', slide_surface_list )
+    src.submit_or_write(writer, src.save_array, data_path + '_sliding_faces', slide_surface_list)
 
     # cartilage surface
     cart_tri = igl.boundary_facets(physical_elements[:len(elemC_idxs)])
@@ -264,28 +420,22 @@ def leg_filter (csg_output_dir, output_path, data_path,  vertices_c, faces_c, ve
     if output_dimension == "m":
         physical_vertices = physical_vertices / 1000
 
-    meshio.write_points_cells(
-        output_path + '.msh',
-        points=physical_vertices,
-        cells=[("tetra", physical_elements)],
-        cell_data={"gmsh:physical": np.array([labels]), "gmsh:geometrical": np.array([labels])},
-        file_format="gmsh22",
-        binary=False,
-    )
+    src.submit_or_write(writer, write_volume_mesh, output_path, physical_vertices, physical_elements, labels, volume_format)
 
     mylist = [len(elemC_idxs), len(elemF_idxs) ]
-    np.save( data_path + '_element_idxs_list', mylist )
+    src.submit_or_write(writer, src.save_array, data_path + '_element_idxs_list', mylist)
 
     # save the surface mesh of the femur
     f_vertices, f_faces, _, _ = igl.remove_unreferenced(physical_vertices, flipped_femur_tri)
     fc_vertices, fc_faces, _, _ = igl.remove_unreferenced(physical_vertices, flipped_cart_tri)
 
-    igl.write_triangle_mesh( output_path + '_bn_femur.obj', f_vertices, f_faces)
-    igl.write_triangle_mesh( output_path + '_jnt_fc.obj', fc_vertices, fc_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_bn_femur.obj', f_vertices, f_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_jnt_fc.obj', fc_vertices, fc_faces)
 
 
 def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1, vertices_2, faces_2, vertices_3, faces_3, vertices_4, faces_4,
-                  vertices_5, faces_5, vertices_6, faces_6, vertices_7, faces_7, vertices_8, faces_8, input_dimension, output_dimension ):
+                  vertices_5, faces_5, vertices_6, faces_6, vertices_7, faces_7, vertices_8, faces_8, input_dimension, output_dimension,
+                  volume_format="gmsh22_binary", writer=None):
 
     raw_vertices, raw_elements = read_volume_mesh(csg_output_dir +"__all.msh", input_dimension, output_dimension)
 
@@ -385,7 +535,7 @@ def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1,
     eight = len(elem_idxs_8)
 
     mylist = [one, two, three, four, five, six, seven, eight ]
-    np.save(data_path + '_element_idxs_list', mylist)
+    src.submit_or_write(writer, src.save_array, data_path + '_element_idxs_list', mylist)
 
     # remove unreferenced
     physical_vertices, physical_elements, _, _ = igl.remove_unreferenced(raw_vertices,
@@ -432,6 +582,9 @@ def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1,
     flipped_all_tri = np.copy(all_tri)
     flipped_all_tri[:, [0, 1]] = flipped_all_tri[:, [1, 0]]
 
+    # lookup table of the model surface, to find the triangles of each part in it
+    all_tri_index = src.TriangleIndex(flipped_all_tri)
+
     # rest surface
     lrest_elem_idxs = np.where(labels!=3)
     rrest_elem_idxs = np.where(labels != 4)
@@ -446,21 +599,9 @@ def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1,
     flipped_rrest_tri = np.copy(rrest_tri)
     flipped_rrest_tri[:, [0, 1]] = flipped_rrest_tri[:, [1, 0]]
 
-    lrest_tri_idxs = []
-    for i in range(len(flipped_lrest_tri)):
-        ind = np.where(flipped_all_tri == flipped_lrest_tri[i])[0]
-        m = np.unique(ind, return_counts=True)[1]
-        o = np.where(m == 3)[0]
-        if len(o) != 0:
-            lrest_tri_idxs.append(ind[o[0]])
-
-    rrest_tri_idxs = []
-    for i in range(len(flipped_rrest_tri)):
-        ind = np.where(flipped_all_tri == flipped_rrest_tri[i])[0]
-        m = np.unique(ind, return_counts=True)[1]
-        o = np.where(m == 3)[0]
-        if len(o) != 0:
-            rrest_tri_idxs.append(ind[o[0]])
+    lrest_tri_idxs = all_tri_index.find(flipped_lrest_tri)
+
+    rrest_tri_idxs = all_tri_index.find(flipped_rrest_tri)
 
     lslide_tri_idxs = np.delete(all_tri_idxs, lrest_tri_idxs, axis=0)
     rslide_tri_idxs = np.delete(all_tri_idxs, rrest_tri_idxs, axis=0)
@@ -471,8 +612,8 @@ def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1,
     lslide_surface_list = flipped_all_tri[lslide_tri_idxs]
     rslide_surface_list = flipped_all_tri[rslide_tri_idxs]
 
-    np.save(data_path +'_lsliding_faces', lslide_surface_list)
-    np.save(data_path +'_rsliding_faces', rslide_surface_list)
+    src.submit_or_write(writer, src.save_array, data_path + '_lsliding_faces', lslide_surface_list)
+    src.submit_or_write(writer, src.save_array, data_path + '_rsliding_faces', rslide_surface_list)
 
     # save each parts surface
     lsi_elem_idxs = np.where(labels == 1)
@@ -518,14 +659,7 @@ def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1,
     if output_dimension == "m":
         physical_vertices = physical_vertices / 1000
 
-    meshio.write_points_cells(
-        output_path + '.msh',
-        points=physical_vertices,
-        cells=[("tetra", physical_elements)],
-        cell_data={"gmsh:physical": np.array([labels]), "gmsh:geometrical": np.array([labels])},
-        file_format="gmsh22",
-        binary=False,
-    )
+    src.submit_or_write(writer, write_volume_mesh, output_path, physical_vertices, physical_elements, labels, volume_format)
 
     lsi_vertices, lsi_faces, _, _ = igl.remove_unreferenced(physical_vertices, flipped_lsi_tri)
     rsi_vertices, rsi_faces, _, _ = igl.remove_unreferenced(physical_vertices, flipped_rsi_tri)
@@ -536,25 +670,19 @@ def girdle_filter (csg_output_dir, output_path, data_path,  vertices_1, faces_1,
     lp_vertices,  lp_faces,  _, _ = igl.remove_unreferenced(physical_vertices, flipped_lpelvis_tri)
     rp_vertices,  rp_faces,  _, _ = igl.remove_unreferenced(physical_vertices, flipped_rpelvis_tri)
 
-    igl.write_triangle_mesh(output_path + '_jnt_lsi.obj', lsi_vertices, lsi_faces)
-    igl.write_triangle_mesh(output_path + '_jnt_rsi.obj', rsi_vertices, rsi_faces)
-    igl.write_triangle_mesh(output_path + '_jnt_lac.obj', lpc_vertices, lpc_faces)
-    igl.write_triangle_mesh(output_path + '_jnt_rac.obj', rpc_vertices, rpc_faces)
-    igl.write_triangle_mesh(output_path + '_jnt_ps.obj', p_vertices,   p_faces)
-    igl.write_triangle_mesh(output_path + '_bn_sacrum.obj',  s_vertices, s_faces)
-    igl.write_triangle_mesh(output_path + '_bn_lpelvis.obj', lp_vertices,  lp_faces)
-    igl.write_triangle_mesh(output_path + '_bn_rpelvis.obj', rp_vertices,  rp_faces)
-
-    s_face_idxs = []
-    for i in range(len(flipped_sacrum_tri)):
-        ind = np.where(flipped_all_tri == flipped_sacrum_tri[i])[0]
-        m = np.unique(ind, return_counts=True)[1]
-        o = np.where(m == 3)[0]
-        if len(o) != 0:
-            s_face_idxs.append(ind[o[0]])
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_jnt_lsi.obj', lsi_vertices, lsi_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_jnt_rsi.obj', rsi_vertices, rsi_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_jnt_lac.obj', lpc_vertices, lpc_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_jnt_rac.obj', rpc_vertices, rpc_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_jnt_ps.obj', p_vertices, p_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_bn_sacrum.obj', s_vertices, s_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_bn_lpelvis.obj', lp_vertices, lp_faces)
+    src.submit_or_write(writer, src.atomic_write, igl.write_triangle_mesh, output_path + '_bn_rpelvis.obj', rp_vertices, rp_faces)
+
+    s_face_idxs = all_tri_index.find(flipped_sacrum_tri)
 
     wo_inner_surface_list = flipped_all_tri[s_face_idxs]
-    np.save(data_path + '_sacrum_minus_sharing_interfaces', wo_inner_surface_list)
+    src.submit_or_write(writer, src.save_array, data_path + '_sacrum_minus_sharing_interfaces', wo_inner_surface_list)
 
 
 def merge_volume_mesh(vertices_1,
@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import uuid
+
+
+def atomic_write(write_function, path, *args, **kwargs):
+    """
+    This function writes a file under a temporary name in the same folder and renames it to path once it is complete,
+    so a crashed run never leaves a half-written file behind. The temporary name keeps the suffix, so writers that pick
+    the format from the suffix (igl, meshio, np.save) still work.
+
+    :param write_function: function called as write_function(temporary_path, *args, **kwargs)
+    :param path: the final path, including the suffix
+    :return: the final path
+    """
+
+    path = str(path)
+    folder, file_name = os.path.split(path)
+    stem, suffix = os.path.splitext(file_name)
+    tmp_path = os.path.join(folder, '.' + stem + '.' + uuid.uuid4().hex[:8] + '.tmp' + suffix)
+
+    try:
+        write_function(tmp_path, *args, **kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return path
+
+
+def submit_or_write(writer, write_function, *args, **kwargs):
+    """
+    This function hands a write over to an OutputWriter, or runs it right away when no writer is given
+
+    :param writer: OutputWriter or None
+    :param write_function: the function that writes the file
+    """
+
+    if writer is None:
+        write_function(*args, **kwargs)
+    else:
+        writer.submit(write_function, *args, **kwargs)
+
+
+class OutputWriter:
+    """
+    A bounded write-behind queue. submit() returns as soon as the job is queued (it only blocks while max_pending
+    jobs are waiting), the jobs run on background threads, and flush() waits for all of them and raises the first
+    error. The data that is submitted must not be changed afterwards.
+
+    with src.OutputWriter() as writer:
+        src.girdle_filter(..., writer=writer)
+    """
+
+    def __init__(self, max_pending=16, num_workers=1):
+        self._jobs = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(num_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                self._jobs.task_done()
+                return
+            write_function, args, kwargs = job
+            try:
+                write_function(*args, **kwargs)
+            except BaseException as error:
+                with self._lock:
+                    self._errors.append(error)
+            finally:
+                self._jobs.task_done()
+
+    def submit(self, write_function, *args, **kwargs):
+        if not self._threads:
+            raise RuntimeError("the writer is closed")
+        self._jobs.put((write_function, args, kwargs))
+
+    def flush(self):
+        self._jobs.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            if len(errors) > 1:
+                print(len(errors), 'writes failed, raising the first one')
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for _ in self._threads:
+                self._jobs.put(None)
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # the stage failed already, do not hide its error behind a write error
+            try:
+                self.close()
+            except BaseException:
+                pass